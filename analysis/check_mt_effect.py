@@ -1,32 +1,17 @@
 import argparse
-import csv
 import os
 import time
-from glob import glob
 
 import requests
 
 
-def _detect_delimiter(path: str) -> str:
-  with open(path, "r", encoding = "utf-8") as f:
-    line = f.readline()
-  if line.count(";") >= line.count(","):
-    return ";"
-  return ","
-
-
-def _read_metrics_series(path: str, who: str) -> list[tuple[int, float]]:
-  delim = _detect_delimiter(path)
-  out: list[tuple[int, float]] = []
-  with open(path, "r", encoding = "utf-8", newline = "") as f:
-    r = csv.DictReader(f, delimiter = delim)
-    if not r.fieldnames or "day" not in r.fieldnames:
-      raise RuntimeError(f"bad metrics header: {r.fieldnames}")
-    if who not in r.fieldnames:
-      raise RuntimeError(f"cannot find agent column '{who}' in: {r.fieldnames[:10]} ...")
-    for row in r:
-      out.append((int(float(row["day"])), float(row[who])))
-  return out
+def _fetch_metrics_series(api: str, sid: str, who: str) -> list[tuple[int, float]]:
+  # one column of the finished session, sliced server side from the
+  # metrics store instead of parsing the whole csv here
+  r = requests.get(f"{api}/session/{sid}/metrics", params = {"agents": who}, timeout = 60)
+  r.raise_for_status()
+  data = r.json()
+  return list(zip(data["days"], data["values"][who]))
 
 
 def _tail_mean(series: list[tuple[int, float]], tail: int) -> float:
@@ -45,18 +30,6 @@ def _max_abs_diff(a: list[tuple[int, float]], b: list[tuple[int, float]]) -> flo
   return max(abs(da[d] - db[d]) for d in days)
 
 
-def _list_metrics_files(logs_dir: str) -> list[str]:
-  files: list[str] = []
-  for p in (
-    os.path.join(logs_dir, "metrics_*.csv"),
-    os.path.join(logs_dir, "metrics-*.csv"),
-    os.path.join(logs_dir, "metrics*.csv"),
-  ):
-    files.extend(glob(p))
-  files = sorted(set(files), key=lambda x: os.path.getmtime(x) if os.path.exists(x) else 0.0)
-  return files
-
-
 def _parse_create_response(resp: requests.Response) -> str:
   try:
     j = resp.json()
@@ -87,55 +60,34 @@ def _create_session(api: str, cfg: dict) -> str:
   return _parse_create_response(r)
 
 
-def _run_until_metrics(api: str, sid: str, logs_dir: str, wait_sec: float) -> str:
-  prev = set(_list_metrics_files(logs_dir))
-  t_start = time.time()
-  deadline = t_start + wait_sec
-  last_info = None
-
-  while time.time() < deadline:
+def _post_run(api: str, sid: str, t_end: float) -> requests.Response:
+  # 429: the server's run queue is full, come back when it says
+  while True:
     r = requests.post(f"{api}/session/{sid}/run", timeout = 60)
+    if r.status_code != 429:
+      return r
+    delay = float(r.headers.get("Retry-After", "1"))
+    if time.time() + delay > t_end:
+      return r
+    time.sleep(delay)
+
+
+def _run_until_done(api: str, sid: str, wait_sec: float) -> None:
+  # /run only queues the session: wait on its status, the series is read
+  # from the server afterwards, so nothing has to be on a shared disk
+  t_end = time.time() + wait_sec
+  r = _post_run(api, sid, t_end)
+  r.raise_for_status()
+  info = r.json()
+  while info.get("status") in ("created", "queued", "running"):
+    if time.time() > t_end:
+      raise RuntimeError(f"timeout waiting for session {sid}, last_info = {info}")
+    time.sleep(0.2)
+    r = requests.get(f"{api}/session/{sid}", timeout = 60)
     r.raise_for_status()
-
-    info = None
-    try:
-      info = r.json()
-    except Exception:
-      info = {"raw": r.text}
-
-    last_info = info
-
-    metrics_path = None
-    if isinstance(info, dict):
-      mp = info.get("metrics")
-      if isinstance(mp, str) and mp.strip():
-        metrics_path = mp.strip()
-
-    if metrics_path:
-      if os.path.exists(metrics_path) and os.path.getsize(metrics_path) > 0:
-        return metrics_path
-      alt = os.path.join(logs_dir, os.path.basename(metrics_path))
-      if os.path.exists(alt) and os.path.getsize(alt) > 0:
-        return alt
-
-    files = _list_metrics_files(logs_dir)
-    new_files = [
-      f for f in files
-      if f not in prev and os.path.getmtime(f) >= t_start - 0.2 and os.path.getsize(f) > 0
-    ]
-    if new_files:
-      return max(new_files, key=os.path.getmtime)
-
-    sleep_s = 0.2
-    if isinstance(info, dict) and "deadline" in info:
-      try:
-        dl = float(info["deadline"])
-        sleep_s = max(0.05, min(1.0, dl - time.time()))
-      except Exception:
-        pass
-    time.sleep(sleep_s)
-
-  raise RuntimeError(f"timeout waiting metrics sid = {sid}, last_info = {last_info}")
+    info = r.json()
+  if info.get("status") != "done":
+    raise RuntimeError(f"session {sid} {info.get('status')}: {info.get('error')}")
 
 
 def _parse_mt_best(path: str) -> tuple[str, dict]:
@@ -216,32 +168,30 @@ def main() -> None:
   }
 
   baseline_sid = _create_session(args.api, base_cfg)
-  baseline_metrics = _run_until_metrics(args.api, baseline_sid, args.out_dir, args.wait)
-  baseline_series = _read_metrics_series(baseline_metrics, who)
+  _run_until_done(args.api, baseline_sid, args.wait)
+  baseline_series = _fetch_metrics_series(args.api, baseline_sid, who)
 
   chosen_schema = None
   mt_sid = None
-  mt_metrics = None
   mt_series = None
   mt_diff = None
 
   for name, cfg in _override_variants(base_cfg, who, best_strategy):
     try:
       sid = _create_session(args.api, cfg)
-      mpath = _run_until_metrics(args.api, sid, args.out_dir, args.wait)
-      series = _read_metrics_series(mpath, who)
+      _run_until_done(args.api, sid, args.wait)
+      series = _fetch_metrics_series(args.api, sid, who)
       diff = _max_abs_diff(baseline_series, series)
 
       chosen_schema = name
       mt_sid = sid
-      mt_metrics = mpath
       mt_series = series
       mt_diff = diff
       break
     except Exception:
       continue
 
-  if mt_sid is None or mt_metrics is None or mt_series is None or mt_diff is None:
+  if mt_sid is None or mt_series is None or mt_diff is None:
     raise RuntimeError("cannot apply MT override with any known schema")
 
   baseline_final = baseline_series[-1][1]
@@ -251,11 +201,9 @@ def main() -> None:
   identical = mt_diff == 0.0
 
   print(f"baseline_sid = {baseline_sid}")
-  print(f"baseline_metrics = {baseline_metrics}")
   print(f"baseline_final = {baseline_final:.6f}")
   print(f"baseline_tail_mean(tail={args.tail}) = {baseline_tail:.6f}")
   print(f"mt_sid = {mt_sid}")
-  print(f"mt_metrics = {mt_metrics}")
   print(f"mt_final = {mt_final:.6f}")
   print(f"mt_tail_mean(tail={args.tail}) = {mt_tail:.6f}")
   print(f"series_identical = {identical}")
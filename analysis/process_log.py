@@ -4,10 +4,12 @@ import os
 import re
 from collections import defaultdict
 
+from simulator.artefacts import open_artefact, strip_compress_suffix
+
 
 def _detect_delimiter(path: str) -> str:
   candidates = [',', ';', '\t', '|']
-  with open(path, 'r', encoding = 'utf-8') as f:
+  with open_artefact(path, 'r', encoding = 'utf-8') as f:
     for line in f:
       line = line.strip().lstrip('\ufeff')
       if not line:
@@ -72,7 +74,7 @@ def _write_events_summary_yaml(path: str, events_csv: str) -> None:
   counts: dict[str, int] = defaultdict(int)
   days_max = 0
 
-  with open(events_csv, "r", encoding = "utf-8", newline = "") as f:
+  with open_artefact(events_csv, "r", encoding = "utf-8", newline = "") as f:
     r = csv.DictReader(f, delimiter = delim)
     for row in r:
       ev = (row.get("event") or row.get("Event") or "").strip()
@@ -90,6 +92,13 @@ def _write_events_summary_yaml(path: str, events_csv: str) -> None:
       f.write(f"    {k}: {counts[k]}\n")
 
 
+def events_summary_path(out_dir: str, events: str) -> str:
+  """Summary file written for events: named after the events file (e.g. a
+  cached run's game_<sid>.csv.gz), not after whoever asked for it."""
+  base = strip_compress_suffix(os.path.basename(events))
+  return os.path.join(out_dir, f"{os.path.splitext(base)[0]}_summary.yaml")
+
+
 def _is_long_format(fieldnames: list[str]) -> bool:
   low = {x.strip().lower() for x in fieldnames}
   return ("agent" in low or "player" in low or "name" in low) and ("m1" in low or "sa" in low)
@@ -97,8 +106,8 @@ def _is_long_format(fieldnames: list[str]) -> bool:
 
 def main() -> None:
   p = argparse.ArgumentParser()
-  p.add_argument("--metrics", required = True, help = "metrics_*.csv")
-  p.add_argument("--events", default = None, help = "game_*.csv (optional) -> events_summary.yaml")
+  p.add_argument("--metrics", required = True, help = "metrics_*.csv[.gz|.xz]")
+  p.add_argument("--events", default = None, help = "game_*.csv[.gz|.xz] (optional) -> events_summary.yaml")
   p.add_argument("--t", type = int, default = 500, help = "max day to export")
   p.add_argument("--out_dir", default = "data/logs")
   p.add_argument("--only_first", type = int, default = 0, help = "limit number of agents exported (0 = all)")
@@ -107,7 +116,7 @@ def main() -> None:
   _ensure_dir(args.out_dir)
 
   delim = _detect_delimiter(args.metrics)
-  with open(args.metrics, "r", encoding = "utf-8", newline = "") as f:
+  with open_artefact(args.metrics, "r", encoding = "utf-8", newline = "") as f:
     r = csv.DictReader(f, delimiter=delim)
     if not r.fieldnames:
       raise SystemExit("empty metrics header")
@@ -167,9 +176,7 @@ def main() -> None:
         _write_awareness_yaml(os.path.join(args.out_dir, f"awareness-{nn}.yaml"), a, series_map[a])
 
   if args.events:
-    base = os.path.basename(args.events)
-    out_yaml = os.path.join(args.out_dir, f"{os.path.splitext(base)[0]}_summary.yaml")
-    _write_events_summary_yaml(out_yaml, args.events)
+    _write_events_summary_yaml(events_summary_path(args.out_dir, args.events), args.events)
 
   print(f"ok: awareness files in {args.out_dir}")
 
@@ -1,14 +1,35 @@
 import argparse
 import csv
 import json
+import math
+import multiprocessing
 import os
 import random
 import re
 import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 from glob import glob
+from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from optimizer.search import CMAES, TPE
+from simulator.artefacts import open_artefact
+
+
+# one pooled keep-alive connection set for every call to the server
+_http = requests.Session()
+
+
+def _configure_http(parallel: int) -> None:
+  # a connection per evaluation in flight, reused between calls
+  adapter = HTTPAdapter(pool_connections = 4, pool_maxsize = max(10, parallel))
+  _http.mount("http://", adapter)
+  _http.mount("https://", adapter)
 
 
 @dataclass(frozen = True)
@@ -29,11 +50,43 @@ class Strategy:
     }
 
 
+@dataclass
+class Scored:
+  who: str
+  score: float
+  sids: list[str]
+  cpu_sec: float
+  # --paired: mean difference to the baseline on the same seeds, 95% CI half-width
+  diff: float | None = None
+  ci: float | None = None
+
+
+# two-sided 95% Student t quantiles for 1..30 degrees of freedom
+_T95 = [
+  12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+  2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+  2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+
+
+def _mean_ci(xs: list[float]) -> tuple[float, float]:
+  """Mean and half-width of its 95% confidence interval (inf for one value)."""
+  n = len(xs)
+  mean = sum(xs) / n
+  if n < 2:
+    return mean, float("inf")
+  sd = math.sqrt(sum((x - mean) ** 2 for x in xs) / (n - 1))
+  t = _T95[n - 2] if n - 2 < len(_T95) else 1.96
+  return mean, t * sd / math.sqrt(n)
+
+
 def _list_metrics_files(logs_dir: str) -> list[str]:
   patterns = [
     os.path.join(logs_dir, "metrics_*.csv"),
     os.path.join(logs_dir, "metrics-*.csv"),
     os.path.join(logs_dir, "metrics*.csv"),
+    os.path.join(logs_dir, "metrics*.csv.gz"),
+    os.path.join(logs_dir, "metrics*.csv.xz"),
   ]
   files: list[str] = []
   for p in patterns:
@@ -43,29 +96,56 @@ def _list_metrics_files(logs_dir: str) -> list[str]:
 
 
 def _detect_delimiter(path: str) -> str:
-  with open(path, "r", encoding = "utf-8") as f:
+  with open_artefact(path, "r", encoding = "utf-8") as f:
     head = f.readline()
   if head.count(";") >= head.count(","):
     return ";"
   return ","
 
 
-def _read_metric_series(metrics_csv: str, who: str) -> tuple[list[int], list[float]]:
+def _read_metric_columns(metrics_csv: str, whos: list[str]) -> tuple[list[int], dict[str, list[float]]]:
   delim = _detect_delimiter(metrics_csv)
   days: list[int] = []
-  vals: list[float] = []
-  with open(metrics_csv, "r", encoding = "utf-8", newline = "") as f:
+  vals: dict[str, list[float]] = {w: [] for w in whos}
+  with open_artefact(metrics_csv, "r", encoding = "utf-8", newline = "") as f:
     reader = csv.DictReader(f, delimiter = delim)
     if not reader.fieldnames or "day" not in reader.fieldnames:
       raise RuntimeError(f"bad metrics header: {reader.fieldnames}")
-    if who not in reader.fieldnames:
-      raise RuntimeError(f"cannot find '{who}' column in: {reader.fieldnames[:10]} ...")
+    for who in whos:
+      if who not in reader.fieldnames:
+        raise RuntimeError(f"cannot find '{who}' column in: {reader.fieldnames[:10]} ...")
     for row in reader:
       days.append(int(float(row["day"])))
-      vals.append(float(row[who]))
+      for who in whos:
+        vals[who].append(float(row[who]))
   return days, vals
 
 
+def _read_metric_series(metrics_csv: str, who: str) -> tuple[list[int], list[float]]:
+  days, vals = _read_metric_columns(metrics_csv, [who])
+  return days, vals[who]
+
+
+def _fetch_metric_series(api: str, sid: str, who: str) -> tuple[list[int], list[float]]:
+  # one column of a finished session's metrics, read server side
+  # (raw arrays when the server speaks them, JSON from older ones)
+  from server.frames import FRAME, decode_frame
+
+  r = _http.get(
+    f"{api}/session/{sid}/metrics",
+    params = {"agents": who},
+    headers = {"Accept": f"{FRAME}, application/json;q=0.5"},
+    timeout = 60,
+  )
+  r.raise_for_status()
+  if r.headers.get("content-type", "").startswith(FRAME):
+    meta, arrays = decode_frame(r.content)
+    scale = float(meta["scale"])
+    return list(arrays["days"][1]), [round(k * scale, 6) for k in arrays["known"][1]]
+  data = r.json()
+  return data["days"], data["values"][who]
+
+
 def _score(vals: list[float], mode: str, tail: int) -> float:
   if not vals:
     return 0.0
@@ -85,7 +165,7 @@ def _parse_kv_text(text: str) -> dict:
 
 
 def _create_session(api: str, cfg: dict) -> str:
-  r = requests.post(f"{api}/session/create", json = cfg, timeout = 60)
+  r = _http.post(f"{api}/session/create", json = cfg, timeout = 60)
   r.raise_for_status()
 
   sid = None
@@ -174,6 +254,18 @@ def _find_new_metrics_file(logs_dir: str, sid: str, t_start: float, prev_set: se
   return None
 
 
+def _post_run(api: str, sid: str, t_end: float) -> requests.Response:
+  # 429: the server's run queue is full, come back when it says
+  while True:
+    r = _http.post(f"{api}/session/{sid}/run", timeout = 60)
+    if r.status_code != 429:
+      return r
+    delay = float(r.headers.get("Retry-After", "1"))
+    if time.time() + delay > t_end:
+      return r
+    time.sleep(delay)
+
+
 def _wait_run_done(api: str, sid: str, logs_dir: str, wait_sec: float) -> tuple[str, str | None, str | None]:
   prev_files = set(_list_metrics_files(logs_dir))
   t_start = time.time()
@@ -184,7 +276,7 @@ def _wait_run_done(api: str, sid: str, logs_dir: str, wait_sec: float) -> tuple[
 
   while time.time() - t_start < wait_sec:
     try:
-      r = requests.post(f"{api}/session/{sid}/run", timeout=60)
+      r = _post_run(api, sid, t_start + wait_sec)
       r.raise_for_status()
       info = _try_get_json(r)
       last_info = info
@@ -210,10 +302,17 @@ def _wait_run_done(api: str, sid: str, logs_dir: str, wait_sec: float) -> tuple[
       if (status in ("done", "ok", "finished", "complete")) and metrics:
         return metrics, csv_path, xml_path
 
-      new_m = _find_new_metrics_file(logs_dir, sid, t_start, prev_files)
-      if new_m is not None:
-        return new_m, csv_path, xml_path
+      if status in ("failed", "cancelled", "timeout"):
+        raise RuntimeError(f"session {sid} {status}: {info.get('error')}")
 
+      # queued / running sessions are still writing their metrics file
+      if status not in ("created", "queued", "running"):
+        new_m = _find_new_metrics_file(logs_dir, sid, t_start, prev_files)
+        if new_m is not None:
+          return new_m, csv_path, xml_path
+
+    except RuntimeError:
+      raise
     except Exception:
       new_m = _find_new_metrics_file(logs_dir, sid, t_start, prev_files)
       if new_m is not None:
@@ -235,6 +334,41 @@ def _wait_run_done(api: str, sid: str, logs_dir: str, wait_sec: float) -> tuple[
   )
 
 
+def _wait_scores(api: str, sid: str, wait_sec: float) -> tuple[dict[str, float], dict]:
+  # score-only sessions: the server computes the scores, no files to look for;
+  # also returns what the run cost (resources, empty from older servers)
+  t_start = time.time()
+  last_info = None
+  while time.time() - t_start < wait_sec:
+    r = _post_run(api, sid, t_start + wait_sec)
+    r.raise_for_status()
+    info = _try_get_json(r)
+    last_info = info
+    status = info.get("status")
+    if status == "done":
+      scores = info.get("scores")
+      if not isinstance(scores, dict):
+        raise RuntimeError(f"server returned no scores: {info}")
+      return {k: float(v) for k, v in scores.items()}, info.get("resources") or {}
+    if status in ("failed", "cancelled", "timeout"):
+      raise RuntimeError(f"session {sid} {status}: {info.get('error')}")
+    time.sleep(0.2)
+
+  raise RuntimeError(f"run timeout\nsid = {sid}\nlast_info = {last_info}\n")
+
+
+def _run_local(cfg: dict, logs_dir: str) -> tuple[str, dict[str, float], dict, str | None]:
+  # --backend local: the engine in a pool worker, no server; files only for
+  # the outputs cfg asks for: (sid, scores, resources, metrics path)
+  # imported here: the http backend needs no engine
+  from simulator.engine import run_session
+
+  sid = uuid.uuid4().hex[:12]
+  out = run_session(sid, cfg, Path(logs_dir))
+  metrics = out.get("metrics")
+  return sid, out.get("scores") or {}, out["resources"], str(metrics) if metrics else None
+
+
 def _fix_sum_100(a: int, b: int, c: int) -> tuple[int, int, int]:
   a = max(0, min(100, a))
   b = max(0, min(100, b))
@@ -272,6 +406,146 @@ def _sample_strategy(rng: random.Random) -> Strategy:
   )
 
 
+def _unit_strategy(u: list[float]) -> Strategy:
+  # u in [0, 1]^4; (u0, u1) -> left/right/home by stick breaking, which maps
+  # the uniform square onto the uniform simplex, u2 and u3 -> the exchanges
+  r = math.sqrt(u[0])
+  p_left, p_right, p_home = _fix_sum_100(
+    int(round(100 * (1 - r))),
+    int(round(100 * r * (1 - u[1]))),
+    int(round(100 * r * u[1])),
+  )
+  return Strategy(
+    p_left = p_left,
+    p_right = p_right,
+    p_home = p_home,
+    p_house_exch = int(round(100 * u[2])),
+    p_pet_exch = int(round(100 * u[3])),
+  )
+
+
+class _RandomSearch:
+  """Uniform samples, the same sequence as before --search existed."""
+
+  def __init__(self, rng: random.Random) -> None:
+    self.rng = rng
+
+  def ask(self) -> Strategy | None:
+    return _sample_strategy(self.rng)
+
+  def tell(self, strategy: Strategy, score: float) -> None:
+    pass
+
+
+class _UnitSearch:
+  """Strategies from an optimizer.search maximiser over the unit cube."""
+
+  def __init__(self, searcher: CMAES | TPE) -> None:
+    self.searcher = searcher
+    self._pending: list[tuple[Strategy, list[float]]] = []
+
+  def ask(self) -> Strategy | None:
+    u = self.searcher.ask()
+    if u is None:
+      return None
+    st = _unit_strategy(u)
+    self._pending.append((st, u))
+    return st
+
+  def tell(self, strategy: Strategy, score: float) -> None:
+    for i, (st, u) in enumerate(self._pending):
+      if st is strategy:
+        del self._pending[i]
+        self.searcher.tell(u, score)
+        return
+
+
+def _make_search(name: str, rng: random.Random) -> _RandomSearch | _UnitSearch:
+  if name == "cmaes":
+    return _UnitSearch(CMAES(4, rng))
+  if name == "tpe":
+    return _UnitSearch(TPE(4, rng))
+  return _RandomSearch(rng)
+
+
+def _rung_schedule(days: int, n_seeds: int, rungs: int, eta: int, min_days: int) -> list[tuple[int, int]]:
+  """(days, seeds) of each racing rung, cheapest first; the last one is the full evaluation."""
+  out: list[tuple[int, int]] = []
+  for r in range(rungs):
+    f = eta ** (rungs - 1 - r)
+    out.append((max(min(min_days, days), -(-days // f)), max(1, -(-n_seeds // f))))
+  return out
+
+
+def _brackets(racing: str, n: int, rungs: int, eta: int) -> list[tuple[int, int]]:
+  """(candidates, first rung) of the successive-halving brackets that try n candidates."""
+  if racing == "sh":
+    return [(n, 0)]
+  # hyperband: from many candidates on every rung down to a few at full
+  # fidelity only, each bracket about the same cost; repeated until n are tried
+  s_max = rungs - 1
+  out: list[tuple[int, int]] = []
+  while n > 0:
+    for s in range(s_max, -1, -1):
+      m = min(n, math.ceil((s_max + 1) / (s + 1) * eta ** s))
+      if m > 0:
+        out.append((m, s_max - s))
+        n -= m
+  return out
+
+
+# convergence rows: (trial, simulations, agent_days, score, best so far)
+Convergence = list[tuple[int, int, int, float, float]]
+
+
+def _write_convergence(path: str, search: str, rows: Convergence) -> None:
+  with open(path, "w", encoding = "utf-8", newline = "") as f:
+    w = csv.writer(f)
+    w.writerow(["search", "trial", "simulations", "agent_days", "score", "best"])
+    for row in rows:
+      w.writerow([search, *row])
+
+
+def _cost_to_reach(rows: Convergence, target: float) -> tuple[int, int] | None:
+  for _, sims, agent_days, _, best in rows:
+    if best >= target:
+      return sims, agent_days
+  return None
+
+
+def _print_convergence(search: str, rows: Convergence, out_dir: str) -> None:
+  if not rows:
+    return
+  best = rows[-1][4]
+  trial, sims, agent_days = next((t, n, ad) for t, n, ad, sc, _ in rows if sc == best)
+  # 95% of the way from the first trial to the best one
+  target = rows[0][3] + 0.95 * (best - rows[0][3])
+  near = next(r[0] for r in rows if r[4] >= target)
+  print(f"search {search}: best {best:.4f} at trial {trial} ({sims} simulations, {agent_days} agent-days), 95% of it by trial {near}")
+  if search == "random":
+    return
+  ref = os.path.join(out_dir, "mt_convergence_random.csv")
+  if not os.path.exists(ref):
+    return
+  with open(ref, encoding = "utf-8", newline = "") as f:
+    ref_rows = [
+      (int(r["trial"]), int(r["simulations"]), int(r.get("agent_days") or 0), float(r["score"]), float(r["best"]))
+      for r in csv.DictReader(f)
+    ]
+  if not ref_rows:
+    return
+  ref_best = ref_rows[-1][4]
+  got = _cost_to_reach(rows, ref_best)
+  ref_sims, ref_days = _cost_to_reach(ref_rows, ref_best) or (0, 0)
+  if got is None:
+    print(f"search {search}: random search best {ref_best:.4f} ({ref_sims} simulations) not reached")
+  else:
+    print(
+      f"search {search}: random search best {ref_best:.4f} reached in {got[0]} simulations, {got[1]} agent-days"
+      f" (random: {ref_sims}, {ref_days})"
+    )
+
+
 def _write_yaml(path: str, data: dict) -> None:
   lines: list[str] = []
   for k, v in data.items():
@@ -285,9 +559,25 @@ def _write_yaml(path: str, data: dict) -> None:
     f.write("\n".join(lines) + "\n")
 
 
+def _slot_agents(who: str, k: int, houses: int, agents: int) -> list[str]:
+  # candidates share one simulation, so give them agents with the same home
+  # house (a{i}, a{i+houses}, ...) to keep the slots comparable
+  if k <= 1:
+    return [who]
+  m = re.fullmatch(r"a(\d+)", who)
+  if m is None:
+    raise SystemExit(f"--batch needs --who of the form aN, got {who}")
+  base = int(m.group(1))
+  slots = [base + j * houses for j in range(k)]
+  if slots[-1] >= agents:
+    raise SystemExit(f"--batch {k} needs at least {slots[-1] + 1} agents with --houses {houses}")
+  return [f"a{i}" for i in slots]
+
+
 def main() -> None:
   ap = argparse.ArgumentParser()
   ap.add_argument("--api", default = "http://127.0.0.1:8000")
+  ap.add_argument("--backend", default = "http", choices = ["http", "local"], help = "local: run the engine in-process, no server")
   ap.add_argument("--agents", type = int, default = 1000)
   ap.add_argument("--houses", type = int, default = 6)
   ap.add_argument("--days", type = int, default = 200)
@@ -299,9 +589,18 @@ def main() -> None:
   ap.add_argument("--score", default = "final", choices = ["final", "mean_tail"])
   ap.add_argument("--tail", type = int, default = 20)
   ap.add_argument("--wait", type = int, default = 600)
+  ap.add_argument("--budget_cpu_sec", type = float, default = 0.0, help = "stop the search once candidate runs used this much CPU (0 = no budget)")
   ap.add_argument("--out_dir", default = "data/logs")
   ap.add_argument("--logs_dir", default = "data/logs")
   ap.add_argument("--rng_seed", type = int, default = 42)
+  ap.add_argument("--batch", type = int, default = 1, help = "candidates scored per simulation (mt_overrides)")
+  ap.add_argument("--parallel", type = int, default = 1, help = "simulations in flight at once (seeds and candidates)")
+  ap.add_argument("--search", default = "random", choices = ["random", "cmaes", "tpe"], help = "how candidates are proposed")
+  ap.add_argument("--racing", default = "off", choices = ["off", "sh", "hyperband"], help = "successive halving over cheaper rungs (fewer seeds and days)")
+  ap.add_argument("--rungs", type = int, default = 3, help = "racing rungs, the last one is the full --days on every seed")
+  ap.add_argument("--eta", type = int, default = 3, help = "racing: 1/eta of a rung is promoted, with eta times the seeds and days")
+  ap.add_argument("--crn", action = "store_true", help = "common random numbers: per-agent random streams in every run")
+  ap.add_argument("--paired", action = "store_true", help = "score candidates by their difference to the baseline on each seed, with a 95%% CI")
   args = ap.parse_args()
 
   seeds = [int(x) for x in args.seeds.split(",") if x.strip()]
@@ -310,94 +609,333 @@ def main() -> None:
   trials_csv = os.path.join(args.out_dir, "mt_trials.csv")
   best_yaml = os.path.join(args.out_dir, "mt_best.yaml")
   compare_png = os.path.join(args.out_dir, "mt_compare.png")
+  label = args.search if args.racing == "off" else f"{args.search}_{args.racing}"
+  convergence_csv = os.path.join(args.out_dir, f"mt_convergence_{label}.csv")
 
   rng = random.Random(args.rng_seed)
+  slots = _slot_agents(args.who, max(1, args.batch), args.houses, args.agents)
+  parallel = max(1, args.parallel)
+  _configure_http(parallel)
+  pool = ThreadPoolExecutor(max_workers = parallel)
+  # engine workers of the local backend (the threads above wait on them)
+  procs = None
+  if args.backend == "local":
+    procs = ProcessPoolExecutor(max_workers = parallel, mp_context = multiprocessing.get_context("spawn"))
+
+  def session_cfg(sd: int, days: int | None = None) -> dict:
+    return {
+      "agents": args.agents,
+      "houses": args.houses,
+      "days": days or args.days,
+      "share": args.share,
+      "noise": args.noise,
+      "seed": sd,
+      **({"crn": True} if args.crn else {}),
+    }
 
-  def eval_strategy(strategy: Strategy | None) -> tuple[float, list[str], list[str]]:
-    scores: list[float] = []
+  def strategy_cfg(sd: int, whos: list[str], strategies: list[Strategy], days: int | None = None) -> dict:
+    cfg = session_cfg(sd, days)
+    if len(strategies) == 1:
+      cfg["mt_who"] = whos[0]
+      cfg["mt_strategy"] = strategies[0].as_dict()
+    else:
+      cfg["mt_overrides"] = {w: st.as_dict() for w, st in zip(whos, strategies)}
+    return cfg
+
+  # cost of the candidate runs: measured CPU seconds (for --budget_cpu_sec),
+  # simulations and simulated agent-days
+  spent = {"cpu_sec": 0.0, "sims": 0, "agent_days": 0}
+
+  if args.racing == "off":
+    schedule = [(args.days, len(seeds))]
+  else:
+    min_days = args.tail if args.score == "mean_tail" else 1
+    schedule = _rung_schedule(args.days, len(seeds), max(1, args.rungs), max(2, args.eta), min_days)
+
+  def run_scored(cfg: dict) -> tuple[str, dict[str, float], dict]:
+    if procs is not None:
+      sid, got, res, _ = procs.submit(_run_local, cfg, args.logs_dir).result()
+      return sid, got, res
+    sid = _create_session(args.api, cfg)
+    got, res = _wait_scores(args.api, sid, float(args.wait))
+    return sid, got, res
+
+  def submit_batch(strategies: list[Strategy], rung: int = 0) -> tuple[list[str], list[Future]]:
+    # every seed of the batch at once; the pool bounds what runs in parallel
+    days, n_seeds = schedule[rung]
+    whos = slots[:len(strategies)]
+    futs: list[Future] = []
+    for sd in seeds[:n_seeds]:
+      cfg = strategy_cfg(sd, whos, strategies, days)
+      cfg["score"] = {"who": whos, "mode": args.score, "tail": args.tail}
+      cfg["outputs"] = []
+      futs.append(pool.submit(run_scored, cfg))
+    return whos, futs
+
+  # baseline scores of the slot agents by (seed, days), for --paired
+  base_scores: dict[tuple[int, int], dict[str, float]] = {}
+
+  def collect_batch(whos: list[str], futs: list[Future], rung: int = 0) -> list[Scored]:
+    days = schedule[rung][0]
+    scores: dict[str, list[float]] = {w: [] for w in whos}
     sids: list[str] = []
-    metrics_paths: list[str] = []
-
-    for sd in seeds:
-      cfg = {
-        "agents": args.agents,
-        "houses": args.houses,
-        "days": args.days,
-        "share": args.share,
-        "noise": args.noise,
-        "seed": sd,
-      }
-      if strategy is not None:
-        cfg["mt_who"] = args.who
-        cfg["mt_strategy"] = strategy.as_dict()
-
-      sid = _create_session(args.api, cfg)
-      metrics_path, _, _ = _wait_run_done(args.api, sid, args.logs_dir, float(args.wait))
-
-      _, vals = _read_metric_series(metrics_path, args.who)
-      scores.append(_score(vals, args.score, args.tail))
-      sids.append(sid)
-      metrics_paths.append(metrics_path)
+    cpu = 0.0
 
-    return float(sum(scores) / len(scores)), sids, metrics_paths
-
-  baseline_score, baseline_sids, baseline_metrics = eval_strategy(None)
-
-  best_strategy = _sample_strategy(rng)
-  best_score, best_sids, best_metrics = eval_strategy(best_strategy)
+    # in seed order, whatever finished first: same results as one by one
+    for fut in futs:
+      sid, got, res = fut.result()
+      for w in whos:
+        scores[w].append(got[w])
+      sids.append(sid)
+      cpu += float(res.get("cpu_sec") or res.get("wall_sec") or 0.0)
+
+    spent["cpu_sec"] += cpu
+    spent["sims"] += len(futs)
+    spent["agent_days"] += len(futs) * args.agents * days
+    out: list[Scored] = []
+    for w in whos:
+      r = Scored(w, float(sum(scores[w]) / len(scores[w])), sids, cpu)
+      if args.paired:
+        r.diff, r.ci = _mean_ci([x - base_scores[(sd, days)][w] for sd, x in zip(seeds, scores[w])])
+      out.append(r)
+    return out
+
+  def run_baseline(sd: int, days: int | None = None) -> tuple[str, dict[str, float], str]:
+    # every slot agent is scored: --paired compares each candidate with its own slot
+    if procs is not None or days is not None:
+      # scored in memory like the candidates: no metrics file
+      cfg = session_cfg(sd, days)
+      cfg["score"] = {"who": slots, "mode": args.score, "tail": args.tail}
+      cfg["outputs"] = []
+      sid, got, _ = run_scored(cfg)
+      return sid, got, ""
+    sid = _create_session(args.api, session_cfg(sd))
+    metrics_path, _, _ = _wait_run_done(args.api, sid, args.logs_dir, float(args.wait))
+    _, vals = _read_metric_columns(metrics_path, slots)
+    return sid, {w: _score(vals[w], args.score, args.tail) for w in slots}, metrics_path
+
+  def eval_baseline() -> tuple[float, list[str], list[str]]:
+    runs = list(pool.map(run_baseline, seeds))
+    for sd, (_, got, _) in zip(seeds, runs):
+      base_scores[(sd, args.days)] = got
+    scores = [got[args.who] for _, got, _ in runs]
+    return float(sum(scores) / len(scores)), [sid for sid, _, _ in runs], [mp for _, _, mp in runs]
+
+  baseline_score, baseline_sids, baseline_metrics = eval_baseline()
+  if args.paired:
+    # cheaper racing rungs are compared with a baseline of the same days
+    need = sorted({(sd, d) for d, n in schedule for sd in seeds[:n]} - base_scores.keys())
+    for key, (_, got, _) in zip(need, pool.map(lambda x: run_baseline(*x), need)):
+      base_scores[key] = got
+
+  search = _make_search(args.search, rng)
+  # candidates are asked for as batches are submitted, so a model-based
+  # search sees every result that came back before it proposes the next one
+  total = args.iters + 1
+  asked = 0
+  convergence: Convergence = []
 
   with open(trials_csv, "w", encoding = "utf-8", newline = "") as f:
     w = csv.writer(f)
-    w.writerow(["kind", "score", "sids", "metrics", "p_left", "p_right", "p_home", "p_house_exch", "p_pet_exch"])
-    w.writerow(["baseline", baseline_score, "|".join(baseline_sids), "|".join(baseline_metrics), "", "", "", "", ""])
     w.writerow([
-      "trial0",
-      best_score,
-      "|".join(best_sids),
-      "|".join(best_metrics),
-      best_strategy.p_left,
-      best_strategy.p_right,
-      best_strategy.p_home,
-      best_strategy.p_house_exch,
-      best_strategy.p_pet_exch,
+      "kind", "score", "sids", "metrics", "p_left", "p_right", "p_home", "p_house_exch", "p_pet_exch", "who", "cpu_sec",
+      "rung", "days", "seeds", "diff", "ci", "trial",
+    ])
+    w.writerow([
+      "baseline", baseline_score, "|".join(baseline_sids), "|".join(baseline_metrics), "", "", "", "", "", args.who, "",
+      "", args.days, len(seeds), "", "", "",
     ])
 
-  for _ in range(args.iters):
-    cand = _sample_strategy(rng)
-    cand_score, cand_sids, cand_metrics = eval_strategy(cand)
+  def value(r: Scored) -> float:
+    # what candidates are ranked by: with the same seeds the mean difference
+    # orders them like the mean score, but comes with its own CI
+    return r.diff if r.diff is not None else r.score
+
+  best: Scored | None = None
+  best_strategy: Strategy | None = None
+
+  def log_trials(idxs: list[int], chunk: list[Strategy], results: list[Scored], rung: int) -> None:
+    days, n_seeds = schedule[rung]
     with open(trials_csv, "a", encoding = "utf-8", newline = "") as f:
       w = csv.writer(f)
-      w.writerow([
-        "trial",
-        cand_score,
-        "|".join(cand_sids),
-        "|".join(cand_metrics),
-        cand.p_left,
-        cand.p_right,
-        cand.p_home,
-        cand.p_house_exch,
-        cand.p_pet_exch,
-      ])
-    if cand_score > best_score:
-      best_score = cand_score
+      for idx, cand, r in zip(idxs, chunk, results):
+        w.writerow([
+          "trial0" if idx == 0 else "trial",
+          r.score,
+          "|".join(r.sids),
+          "",
+          cand.p_left,
+          cand.p_right,
+          cand.p_home,
+          cand.p_house_exch,
+          cand.p_pet_exch,
+          r.who,
+          f"{r.cpu_sec:.3f}",
+          rung,
+          days,
+          n_seeds,
+          "" if r.diff is None else r.diff,
+          "" if r.ci is None else r.ci,
+          idx,
+        ])
+
+  def record(idx: int, cand: Strategy, r: Scored) -> None:
+    # a full-fidelity result
+    nonlocal best, best_strategy
+    if best is None or value(r) > value(best):
+      first = best is None
+      best = r
       best_strategy = cand
-      best_sids = cand_sids
-      best_metrics = cand_metrics
-      print(f"new best score = {best_score:.4f} strat = {best_strategy}")
-
-  _write_yaml(best_yaml, {
+      if not first:
+        vs = "" if r.diff is None else f" ({r.diff:+.4f} +- {r.ci:.4f} vs baseline)"
+        print(f"new best score = {r.score:.4f}{vs} strat = {best_strategy}")
+    convergence.append((idx, spent["sims"], spent["agent_days"], r.score, best.score))
+
+  def over_budget() -> bool:
+    if args.budget_cpu_sec > 0 and spent["cpu_sec"] >= args.budget_cpu_sec:
+      print(f"cpu budget spent ({spent['cpu_sec']:.1f}s of {args.budget_cpu_sec:.1f}s), {asked} of {total} candidates tried")
+      return True
+    return False
+
+  def ask_chunk(n: int) -> list[Strategy]:
+    chunk: list[Strategy] = []
+    while len(chunk) < n:
+      st = search.ask()
+      if st is None:
+        break
+      chunk.append(st)
+    return chunk
+
+  k = len(slots)
+  if args.racing == "off":
+    # batches in flight: enough to keep `parallel` simulations busy
+    window = max(1, -(-parallel // len(seeds)))
+    inflight: deque[tuple[int, list[Strategy], list[str], list[Future]]] = deque()
+    while asked < total or inflight:
+      while asked < total and len(inflight) < window:
+        if over_budget():
+          total = asked
+          break
+        chunk = ask_chunk(min(k, total - asked))
+        if not chunk:
+          # the search waits for the results in flight
+          break
+        inflight.append((asked, chunk, *submit_batch(chunk)))
+        asked += len(chunk)
+      if not inflight:
+        break
+      # trials are written and compared in candidate order
+      start, chunk, whos, futs = inflight.popleft()
+      results = collect_batch(whos, futs)
+      idxs = list(range(start, start + len(chunk)))
+      log_trials(idxs, chunk, results, 0)
+      for idx, cand, r in zip(idxs, chunk, results):
+        search.tell(cand, value(r))
+        record(idx, cand, r)
+  else:
+    top = len(schedule) - 1
+    eta = max(2, args.eta)
+    # candidates asked before their first-rung scores are told: a model-based
+    # search has to learn within a bracket, random search may ask them all
+    generation = total if args.search == "random" else max(k, parallel)
+
+    def run_rung(chunk: list[Strategy], rung: int) -> list[Scored]:
+      # a rung is a barrier: all of it is scored before anything is promoted
+      batches = [submit_batch(chunk[i:i + k], rung) for i in range(0, len(chunk), k)]
+      return [r for whos, futs in batches for r in collect_batch(whos, futs, rung)]
+
+    print("racing rungs: " + ", ".join(f"{d} days x {n} seeds" for d, n in schedule))
+    plan = deque(_brackets(args.racing, total, len(schedule), eta))
+    stop = False
+    while asked < total and not stop:
+      if not plan:
+        # brackets came out smaller than planned, plan more for the rest
+        plan.extend(_brackets(args.racing, total - asked, len(schedule), eta))
+      n, first_rung = plan.popleft()
+      n = min(n, total - asked)
+      idxs: list[int] = []
+      chunk = []
+      results: list[Scored] = []
+      # the first rung one generation at a time, told to the search before
+      # the next generation is asked
+      while len(chunk) < n:
+        if over_budget():
+          stop = True
+          break
+        gen = ask_chunk(min(generation, n - len(chunk)))
+        if not gen:
+          break
+        gen_idxs = list(range(asked, asked + len(gen)))
+        asked += len(gen)
+        gen_results = run_rung(gen, first_rung)
+        log_trials(gen_idxs, gen, gen_results, first_rung)
+        for cand, r in zip(gen, gen_results):
+          search.tell(cand, value(r))
+        idxs += gen_idxs
+        chunk += gen
+        results += gen_results
+      if not chunk:
+        break
+      for rung in range(first_rung, top + 1):
+        if rung > first_rung:
+          if stop or over_budget():
+            stop = True
+            break
+          results = run_rung(chunk, rung)
+          log_trials(idxs, chunk, results, rung)
+        if rung == top:
+          for idx, cand, r in zip(idxs, chunk, results):
+            record(idx, cand, r)
+          break
+        keep = sorted(range(len(chunk)), key = lambda i: -value(results[i]))[:max(1, len(chunk) // eta)]
+        keep.sort()
+        idxs = [idxs[i] for i in keep]
+        chunk = [chunk[i] for i in keep]
+
+  if asked < args.iters + 1:
+    print(f"warning: {asked} of {args.iters + 1} candidates tried")
+  print(f"candidate runs: {spent['sims']} simulations, {spent['agent_days']} agent-days")
+  _write_convergence(convergence_csv, label, convergence)
+  _print_convergence(label, convergence, args.out_dir)
+  if best is None or best_strategy is None:
+    raise SystemExit("no candidate was evaluated")
+  best_who = best.who
+
+  summary = {
     "who": args.who,
     "baseline_score": baseline_score,
-    "best_score": best_score,
+    "best_score": best.score,
     "best_strategy": best_strategy.as_dict(),
+    "best_scored_as": best_who,
     "baseline_sids": {"sids": "|".join(baseline_sids)},
-    "best_sids": {"sids": "|".join(best_sids)},
-  })
+    "best_sids": {"sids": "|".join(best.sids)},
+  }
+  if best.diff is not None and best.ci is not None:
+    summary["best_diff"] = best.diff
+    summary["best_diff_ci"] = best.ci
+    if best.diff - best.ci > 0:
+      verdict = "better than"
+    elif best.diff + best.ci < 0:
+      verdict = "worse than"
+    else:
+      verdict = "not distinguishable from"
+    print(f"best vs baseline: {best.diff:+.4f} +- {best.ci:.4f} (95% CI, {len(best.sids)} seeds), {verdict} the baseline")
+  _write_yaml(best_yaml, summary)
 
   try:
     import matplotlib.pyplot as plt
-    d1, v1 = _read_metric_series(baseline_metrics[0], args.who)
-    d2, v2 = _read_metric_series(best_metrics[0], args.who)
+    if procs is not None:
+      # both series from a metrics-only replay on the first seed
+      base_cfg = dict(session_cfg(seeds[0]), outputs = ["metrics"])
+      best_cfg = dict(strategy_cfg(seeds[0], [best_who], [best_strategy]), outputs = ["metrics"])
+      d1, v1 = _read_metric_series(procs.submit(_run_local, base_cfg, args.logs_dir).result()[3], args.who)
+      d2, v2 = _read_metric_series(procs.submit(_run_local, best_cfg, args.logs_dir).result()[3], best_who)
+    else:
+      # candidates ran score-only, replay the best one on the first seed for its series
+      best_sid = _create_session(args.api, strategy_cfg(seeds[0], [best_who], [best_strategy]))
+      _wait_run_done(args.api, best_sid, args.logs_dir, float(args.wait))
+      d1, v1 = _fetch_metric_series(args.api, baseline_sids[0], args.who)
+      d2, v2 = _fetch_metric_series(args.api, best_sid, best_who)
     plt.figure()
     plt.plot(d1, v1, label = "baseline")
     plt.plot(d2, v2, label = "mt_best")
@@ -410,8 +948,12 @@ def main() -> None:
   except Exception as e:
     print(f"skip plot: {e}")
 
+  pool.shutdown()
+  if procs is not None:
+    procs.shutdown()
   print(f"saved {best_yaml}")
   print(f"saved {trials_csv}")
+  print(f"saved {convergence_csv}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import math
+import random
+
+
+# Model-based maximisers over the unit cube [0, 1]^dim, ask/tell style:
+# ask() gives the next point to evaluate (None: nothing to offer until more
+# results are told), tell(u, score) reports the score of a point it gave.
+# mt_agent maps points to strategies; nothing here knows about the simulation.
+
+
+def _reflect(x: float) -> float:
+  # mirror into [0, 1]: ... 1.2 -> 0.8, -0.3 -> 0.3, 2.3 -> 0.3 ...
+  x = abs(x) % 2.0
+  return 2.0 - x if x > 1.0 else x
+
+
+def _jacobi_eigen(a: list[list[float]]) -> tuple[list[float], list[list[float]]]:
+  """Eigenvalues and eigenvectors (columns) of a small symmetric matrix."""
+  n = len(a)
+  a = [row[:] for row in a]
+  v = [[1.0 if i == j else 0.0 for j in range(n)] for i in range(n)]
+  for _ in range(100):
+    off = sum(a[i][j] ** 2 for i in range(n) for j in range(n) if i != j)
+    if off < 1e-22:
+      break
+    for p in range(n - 1):
+      for q in range(p + 1, n):
+        if abs(a[p][q]) < 1e-30:
+          continue
+        theta = (a[q][q] - a[p][p]) / (2.0 * a[p][q])
+        t = (1.0 if theta >= 0 else -1.0) / (abs(theta) + math.sqrt(theta * theta + 1.0))
+        c = 1.0 / math.sqrt(t * t + 1.0)
+        s = t * c
+        for k in range(n):
+          akp, akq = a[k][p], a[k][q]
+          a[k][p] = c * akp - s * akq
+          a[k][q] = s * akp + c * akq
+        for k in range(n):
+          apk, aqk = a[p][k], a[q][k]
+          a[p][k] = c * apk - s * aqk
+          a[q][k] = s * apk + c * aqk
+        for k in range(n):
+          vkp, vkq = v[k][p], v[k][q]
+          v[k][p] = c * vkp - s * vkq
+          v[k][q] = s * vkp + c * vkq
+  return [a[i][i] for i in range(n)], v
+
+
+class CMAES:
+  """
+  (mu/mu_w, lambda)-CMA-ES with the default strategy parameters. A generation
+  of lambda points is handed out, the update waits until all of them are told.
+  Points outside the cube are mirrored back and the update uses the mirrored
+  point. sigma is kept above min_sigma: strategies are integers, a smaller
+  step would only repeat them.
+  """
+
+  def __init__(
+    self,
+    dim: int,
+    rng: random.Random,
+    sigma: float = 0.3,
+    popsize: int | None = None,
+    min_sigma: float = 0.02,
+  ) -> None:
+    n = dim
+    self.dim = n
+    self.rng = rng
+    self.sigma = sigma
+    self.min_sigma = min_sigma
+    self.mean = [0.5] * n
+    self.lam = popsize or 4 + int(3 * math.log(n))
+    self.mu = self.lam // 2
+    w = [math.log(self.mu + 0.5) - math.log(i + 1) for i in range(self.mu)]
+    sw = sum(w)
+    self.weights = [x / sw for x in w]
+    self.mueff = 1.0 / sum(x * x for x in self.weights)
+    self.cc = (4 + self.mueff / n) / (n + 4 + 2 * self.mueff / n)
+    self.cs = (self.mueff + 2) / (n + self.mueff + 5)
+    self.c1 = 2 / ((n + 1.3) ** 2 + self.mueff)
+    self.cmu = min(1 - self.c1, 2 * (self.mueff - 2 + 1 / self.mueff) / ((n + 2) ** 2 + self.mueff))
+    self.damps = 1 + 2 * max(0.0, math.sqrt((self.mueff - 1) / (n + 1)) - 1) + self.cs
+    self.chi_n = math.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n * n))
+    self.pc = [0.0] * n
+    self.ps = [0.0] * n
+    self.C = [[1.0 if i == j else 0.0 for j in range(n)] for i in range(n)]
+    self.B = [row[:] for row in self.C]
+    self.D = [1.0] * n
+    self.generation = 0
+    self._asked: list[tuple[float, ...]] = []
+    self._told: dict[tuple[float, ...], float] = {}
+
+  def ask(self) -> list[float] | None:
+    if len(self._asked) >= self.lam:
+      return None
+    n = self.dim
+    z = [self.rng.gauss(0.0, 1.0) for _ in range(n)]
+    y = [sum(self.B[i][j] * self.D[j] * z[j] for j in range(n)) for i in range(n)]
+    u = tuple(_reflect(self.mean[i] + self.sigma * y[i]) for i in range(n))
+    self._asked.append(u)
+    return list(u)
+
+  def tell(self, u: list[float], score: float) -> None:
+    key = tuple(u)
+    if key not in self._asked or key in self._told:
+      return
+    self._told[key] = score
+    if len(self._told) == self.lam:
+      self._update()
+
+  def _update(self) -> None:
+    n = self.dim
+    # best first (maximising)
+    ranked = sorted(self._asked, key = lambda u: -self._told[u])[:self.mu]
+    old = self.mean
+    self.mean = [sum(w * u[i] for w, u in zip(self.weights, ranked)) for i in range(n)]
+    ys = [[(u[i] - old[i]) / self.sigma for i in range(n)] for u in ranked]
+    y = [(self.mean[i] - old[i]) / self.sigma for i in range(n)]
+
+    # C^-1/2 y = B D^-1 B^T y
+    bty = [sum(self.B[k][i] * y[k] for k in range(n)) / self.D[i] for i in range(n)]
+    inv_sqrt_y = [sum(self.B[i][j] * bty[j] for j in range(n)) for i in range(n)]
+    a = math.sqrt(self.cs * (2 - self.cs) * self.mueff)
+    self.ps = [(1 - self.cs) * p + a * v for p, v in zip(self.ps, inv_sqrt_y)]
+    self.generation += 1
+    ps_norm = math.sqrt(sum(p * p for p in self.ps))
+    hsig = ps_norm / math.sqrt(1 - (1 - self.cs) ** (2 * self.generation)) / self.chi_n < 1.4 + 2 / (n + 1)
+    a = math.sqrt(self.cc * (2 - self.cc) * self.mueff) if hsig else 0.0
+    self.pc = [(1 - self.cc) * p + a * v for p, v in zip(self.pc, y)]
+
+    c_old = 0.0 if hsig else self.c1 * self.cc * (2 - self.cc)
+    for i in range(n):
+      for j in range(n):
+        rank_mu = sum(w * yk[i] * yk[j] for w, yk in zip(self.weights, ys))
+        self.C[i][j] = (
+          (1 - self.c1 - self.cmu + c_old) * self.C[i][j]
+          + self.c1 * self.pc[i] * self.pc[j]
+          + self.cmu * rank_mu
+        )
+
+    self.sigma *= math.exp((self.cs / self.damps) * (ps_norm / self.chi_n - 1))
+    self.sigma = max(self.min_sigma, min(1.0, self.sigma))
+    eig, self.B = _jacobi_eigen(self.C)
+    self.D = [math.sqrt(max(e, 1e-20)) for e in eig]
+    self._asked = []
+    self._told = {}
+
+
+def _norm_cdf(x: float) -> float:
+  return 0.5 * (1.0 + math.erf(x / math.sqrt(2.0)))
+
+
+class _Parzen:
+  """Mixture of truncated normals on [0, 1] (bandwidth per dimension) plus a uniform prior."""
+
+  def __init__(self, points: list[tuple[float, ...]], bw: list[float]) -> None:
+    self.points = points
+    self.bw = bw
+    self.prior_weight = 1.0 / (len(points) + 1)
+
+  def sample(self, rng: random.Random) -> tuple[float, ...]:
+    if not self.points or rng.random() < self.prior_weight:
+      return tuple(rng.random() for _ in self.bw)
+    c = rng.choice(self.points)
+    out = []
+    for d, bw in enumerate(self.bw):
+      x = rng.gauss(c[d], bw)
+      for _ in range(20):
+        if 0.0 <= x <= 1.0:
+          break
+        x = rng.gauss(c[d], bw)
+      out.append(min(1.0, max(0.0, x)))
+    return tuple(out)
+
+  def log_pdf(self, u: tuple[float, ...]) -> float:
+    # independent dimensions within each kernel, the prior density is 1
+    total = self.prior_weight
+    w = (1.0 - self.prior_weight) / len(self.points) if self.points else 0.0
+    for c in self.points:
+      k = 1.0
+      for d, bw in enumerate(self.bw):
+        z = (_norm_cdf((1.0 - c[d]) / bw) - _norm_cdf(-c[d] / bw)) * bw * math.sqrt(2 * math.pi)
+        k *= math.exp(-0.5 * ((u[d] - c[d]) / bw) ** 2) / z
+      total += w * k
+    return math.log(max(total, 1e-300))
+
+
+class TPE:
+  """
+  Tree-structured Parzen estimator: after `startup` uniform points, the told
+  points are split into the best `gamma` fraction and the rest, and the next
+  point is the one of `candidates` draws from the good density that maximises
+  good(u) / rest(u). Points can be asked before earlier ones are told.
+  """
+
+  def __init__(
+    self,
+    dim: int,
+    rng: random.Random,
+    startup: int = 10,
+    gamma: float = 0.25,
+    candidates: int = 24,
+    min_bw: float = 0.05,
+  ) -> None:
+    self.dim = dim
+    self.rng = rng
+    self.startup = startup
+    self.gamma = gamma
+    self.candidates = candidates
+    self.min_bw = min_bw
+    self._obs: list[tuple[tuple[float, ...], float]] = []
+    self._asked = 0
+
+  def ask(self) -> list[float] | None:
+    self._asked += 1
+    if len(self._obs) < self.startup or self._asked <= self.startup:
+      return [self.rng.random() for _ in range(self.dim)]
+    ranked = sorted(self._obs, key = lambda o: -o[1])
+    n = len(ranked)
+    # Scott's rule over all the points, shared by both densities: from the
+    # good points alone it shrinks as they cluster and the search collapses
+    bw: list[float] = []
+    for d in range(self.dim):
+      xs = [u[d] for u, _ in ranked]
+      mean = sum(xs) / n
+      std = math.sqrt(sum((x - mean) ** 2 for x in xs) / n)
+      bw.append(min(0.5, max(self.min_bw, 1.06 * std * n ** -0.2)))
+    n_good = max(1, int(math.ceil(self.gamma * n)))
+    good = _Parzen([u for u, _ in ranked[:n_good]], bw)
+    rest = _Parzen([u for u, _ in ranked[n_good:]], bw)
+    best_u, best_ei = None, -math.inf
+    for _ in range(self.candidates):
+      u = good.sample(self.rng)
+      ei = good.log_pdf(u) - rest.log_pdf(u)
+      if ei > best_ei:
+        best_u, best_ei = u, ei
+    return list(best_u)
+
+  def tell(self, u: list[float], score: float) -> None:
+    self._obs.append((tuple(u), score))
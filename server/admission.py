@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import math
+import threading
+from dataclasses import dataclass
+from typing import Any
+
+
+# cost of a run relative to simulating agents x days without writing anything,
+# measured on the engine: all outputs make a run about 6x slower
+_OUTPUT_WEIGHT = {"csv": 2.0, "xml": 1.5, "metrics": 1.5}
+_OCCUPANCY_WEIGHT = 0.1
+
+# agent-days per second of one worker before any run has been timed
+_DEFAULT_RATE = 800_000.0
+
+
+def estimate_cost(cfg: dict[str, Any]) -> float:
+  """Work units of a session: agents x days x (1 + weight of what it writes)."""
+  agents = int(cfg.get("agents", 1000))
+  days = int(cfg.get("days", 200))
+  outputs = cfg.get("outputs", None)
+  outputs = set(_OUTPUT_WEIGHT) if outputs is None else set(outputs)
+  factor = 1.0
+  for out in outputs:
+    w = _OUTPUT_WEIGHT.get(out, 0.0)
+    if out == "metrics":
+      # sparse time series format fewer rows
+      every = cfg.get("metrics_every", None)
+      if every is None and cfg.get("metrics_days"):
+        w *= min(1.0, (len(cfg["metrics_days"]) + 1) / max(1, days))
+      elif every:
+        w /= max(1, int(every))
+    factor += w
+  if cfg.get("occupancy"):
+    factor += _OCCUPANCY_WEIGHT
+  return float(agents * days) * factor
+
+
+class AdmissionError(Exception):
+  """Run refused; retry_after is None when retrying cannot help."""
+
+  def __init__(self, detail: str, retry_after: float | None = None) -> None:
+    super().__init__(detail)
+    self.detail = detail
+    self.retry_after = retry_after
+
+
+@dataclass
+class _Admitted:
+  client: str
+  cost: float
+
+
+class Admission:
+  """
+  Bounded run queue: every queued or running session holds its estimated cost
+  until its job ends. A run is refused for good when it alone is over
+  max_session_cost; it is refused for now when the client already has
+  max_client_inflight sessions in flight, or when it would push the total
+  over max_queue_cost (an empty queue takes any run, however large).
+  Retry-After estimates come from the measured throughput of finished runs.
+  """
+
+  def __init__(
+    self,
+    workers: int,
+    max_queue_cost: float,
+    max_session_cost: float,
+    max_client_inflight: int,
+  ) -> None:
+    self.workers = workers
+    self.max_queue_cost = max_queue_cost
+    self.max_session_cost = max_session_cost
+    self.max_client_inflight = max_client_inflight
+    self.rate = _DEFAULT_RATE
+    self.rejected = 0
+    self._inflight: dict[str, _Admitted] = {}
+    self._per_client: dict[str, int] = {}
+    self._cost = 0.0
+    self._lock = threading.Lock()
+
+  def _retry_after(self, excess: float) -> float:
+    # seconds until the pool has worked off `excess` units
+    return max(1.0, math.ceil(excess / (self.rate * self.workers)))
+
+  def admit(self, client: str, items: list[tuple[str, float]]) -> list[str]:
+    """
+    Reserves all (sid, cost) items for client, or none of them; sids already
+    in flight are left as they are. Returns the sids reserved by this call.
+    """
+    with self._lock:
+      items = [(sid, cost) for sid, cost in items if sid not in self._inflight]
+      if not items:
+        return []
+      for _, cost in items:
+        if cost > self.max_session_cost:
+          self.rejected += 1
+          raise AdmissionError(
+            f"session cost {cost:.3g} is over the limit {self.max_session_cost:.3g} (agents x days x outputs)",
+          )
+      if len(items) > self.max_client_inflight:
+        self.rejected += 1
+        raise AdmissionError(f"{len(items)} sessions at once, per-client limit {self.max_client_inflight}")
+      n = self._per_client.get(client, 0)
+      if n + len(items) > self.max_client_inflight:
+        self.rejected += 1
+        # until the client's cheapest run is done
+        cheapest = min(a.cost for a in self._inflight.values() if a.client == client)
+        raise AdmissionError(
+          f"client has {n} sessions in flight, limit {self.max_client_inflight}",
+          max(1.0, math.ceil(cheapest / self.rate)),
+        )
+      total = sum(cost for _, cost in items)
+      if self._inflight and self._cost + total > self.max_queue_cost:
+        self.rejected += 1
+        # at the latest, it fits once the queue is empty
+        raise AdmissionError(
+          f"run queue is full ({self._cost:.3g} of {self.max_queue_cost:.3g} queued)",
+          self._retry_after(min(self._cost, self._cost + total - self.max_queue_cost)),
+        )
+      for sid, cost in items:
+        self._inflight[sid] = _Admitted(client, cost)
+        self._cost += cost
+      self._per_client[client] = n + len(items)
+      return [sid for sid, _ in items]
+
+  def release(self, sid: str, wall_sec: float | None = None) -> None:
+    with self._lock:
+      a = self._inflight.pop(sid, None)
+      if a is None:
+        return
+      self._cost -= a.cost
+      left = self._per_client[a.client] - 1
+      if left:
+        self._per_client[a.client] = left
+      else:
+        del self._per_client[a.client]
+      if not self._inflight:
+        self._cost = 0.0
+      if wall_sec is not None and wall_sec > 0:
+        # EWMA of one worker's units per second
+        self.rate = 0.8 * self.rate + 0.2 * (a.cost / wall_sec)
+
+  def inflight(self) -> dict[str, tuple[str, float]]:
+    """sid -> (client, cost) of the admitted sessions."""
+    with self._lock:
+      return {sid: (a.client, a.cost) for sid, a in self._inflight.items()}
+
+  def stats(self) -> dict[str, Any]:
+    with self._lock:
+      return {
+        "inflight": len(self._inflight),
+        "queued_cost": self._cost,
+        "max_queue_cost": self.max_queue_cost,
+        "max_session_cost": self.max_session_cost,
+        "max_client_inflight": self.max_client_inflight,
+        "clients": len(self._per_client),
+        "rate_per_worker": self.rate,
+        "rejected": self.rejected,
+      }
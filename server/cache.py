@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any
+
+import simulator.artefacts
+import simulator.engine
+import simulator.metrics_store
+from server.store import SessionStore
+
+
+# cfg keys that do not change what the engine produces
+_NON_KEY_FIELDS = ("cache", "deadline_sec")
+
+_ARTEFACT_MODULES = (simulator.engine, simulator.artefacts, simulator.metrics_store)
+
+
+def _engine_digest() -> str:
+  # results are only reusable for the code that produced them: the engine and
+  # every module that writes its artefacts
+  h = hashlib.sha256()
+  for module in _ARTEFACT_MODULES:
+    h.update(module.__name__.encode("utf-8") + b"\0")
+    h.update(Path(module.__file__).read_bytes())
+  return h.hexdigest()[:16]
+
+
+class ResultCache:
+  """
+  Content-addressed reuse of finished runs: normalised config hash -> artefacts.
+  Only seeded configs are cached (unseeded runs derive the seed from the sid).
+  The key is stored with the session, so cached results live and are evicted
+  (files included) with the sessions in the store.
+  """
+
+  def __init__(self, store: SessionStore) -> None:
+    self.store = store
+    self.hits = 0
+    self.misses = 0
+    self._engine = _engine_digest()
+
+  def key(self, cfg: dict[str, Any]) -> str | None:
+    if cfg.get("seed") is None:
+      return None
+    norm = {k: v for k, v in cfg.items() if k not in _NON_KEY_FIELDS}
+    blob = json.dumps({"engine": self._engine, "cfg": norm}, sort_keys = True, separators = (",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+  def get(self, key: str) -> dict[str, Any] | None:
+    files = self.store.find_cached(key)
+    if files is None:
+      self.misses += 1
+    else:
+      self.hits += 1
+    return files
+
+  def stats(self) -> dict[str, Any]:
+    st = self.store.stats()
+    return {
+      "entries": st["cached_configs"],
+      "bytes": st["bytes"],
+      "max_bytes": st["max_bytes"],
+      "hits": self.hits,
+      "misses": self.misses,
+      "evictions": st["evictions"],
+    }
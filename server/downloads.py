@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import gzip
+import lzma
+import re
+import zlib
+from email.utils import formatdate
+from pathlib import Path
+from typing import IO, Any, Iterator
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+
+CHUNK = 64 * 1024
+# below this size gzip is not worth the round trip
+GZIP_MIN_BYTES = 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _read_chunks(f: IO[bytes], start: int = 0, length: int | None = None) -> Iterator[bytes]:
+  with f:
+    if start:
+      f.seek(start)
+    left = length
+    while left is None or left > 0:
+      chunk = f.read(CHUNK if left is None else min(CHUNK, left))
+      if not chunk:
+        break
+      if left is not None:
+        left -= len(chunk)
+      yield chunk
+
+
+def _gzip_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+  z = zlib.compressobj(6, zlib.DEFLATED, 31)
+  for chunk in chunks:
+    out = z.compress(chunk)
+    if out:
+      yield out
+  yield z.flush()
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+  """Single byte range -> (start, end inclusive); None when unsatisfiable."""
+  m = _RANGE_RE.match(header.strip())
+  if m is None:
+    raise ValueError(header)
+  first, last = m.group(1), m.group(2)
+  if first == "":
+    if last == "":
+      raise ValueError(header)
+    n = int(last)
+    if n == 0:
+      return None
+    return max(0, size - n), size - 1
+  start = int(first)
+  end = size - 1 if last == "" else min(int(last), size - 1)
+  if start >= size or end < start:
+    return None
+  return start, end
+
+
+def file_response(request: Request, path: Path, media_type: str, filename: str) -> Response:
+  """
+  Streams an artefact with ETag / If-None-Match, single-range requests and gzip.
+
+  - plain file: byte ranges; gzipped on the fly when accepted and no range asked;
+  - .gz file: passed through as Content-Encoding: gzip when accepted
+    (ranges then address the gzip bytes), otherwise decompressed;
+  - .xz file: decompressed (and gzipped when accepted).
+  """
+  st = path.stat()
+  accept_gzip = "gzip" in request.headers.get("accept-encoding", "").lower()
+  range_header = request.headers.get("range")
+  stored = path.suffix if path.suffix in (".gz", ".xz") else ""
+  base_tag = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+  headers: dict[str, str] = {
+    "Last-Modified": formatdate(st.st_mtime, usegmt = True),
+    "Vary": "Accept-Encoding",
+    "Content-Disposition": f'inline; filename="{filename}"',
+  }
+
+  raw = stored == "" or (stored == ".gz" and accept_gzip)
+  if raw:
+    encoding = "gzip" if stored == ".gz" else None
+    gzip_on_the_fly = encoding is None and accept_gzip and not range_header and st.st_size >= GZIP_MIN_BYTES
+  else:
+    encoding = None
+    gzip_on_the_fly = accept_gzip
+
+  if gzip_on_the_fly:
+    etag = f'W/"{base_tag}-gzip"'
+  elif raw:
+    etag = f'"{base_tag}{"-gz" if encoding else ""}"'
+  else:
+    etag = f'W/"{base_tag}-identity"'
+  headers["ETag"] = etag
+
+  inm = request.headers.get("if-none-match")
+  if inm is not None and (inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]):
+    return Response(status_code = 304, headers = headers)
+
+  if encoding is not None or gzip_on_the_fly:
+    headers["Content-Encoding"] = "gzip"
+
+  if raw and not gzip_on_the_fly:
+    headers["Accept-Ranges"] = "bytes"
+    size = st.st_size
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+      try:
+        rng = _parse_range(range_header, size)
+      except ValueError:
+        rng = (0, size - 1) if size else None
+        range_header = None
+      if rng is None:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code = 416, headers = headers)
+      if range_header:
+        start, end = rng
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+          _read_chunks(path.open("rb"), start, end - start + 1),
+          status_code = 206,
+          media_type = media_type,
+          headers = headers,
+        )
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(_read_chunks(path.open("rb")), media_type = media_type, headers = headers)
+
+  if stored == ".gz":
+    src: IO[Any] = gzip.open(path, "rb")
+  elif stored == ".xz":
+    src = lzma.open(path, "rb")
+  else:
+    src = path.open("rb")
+  chunks = _read_chunks(src)
+  if gzip_on_the_fly:
+    chunks = _gzip_chunks(chunks)
+  return StreamingResponse(chunks, media_type = media_type, headers = headers)
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import json
+from array import array
+from typing import Any, Iterable
+
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from server.frames import FRAME, encode_frame
+
+try:
+  import msgpack  # type: ignore
+except ImportError:
+  msgpack = None  # type: ignore[assignment]
+
+
+# Response encodings negotiated with the Accept header:
+#   application/json     default, written by pydantic-core / json without FastAPI's encoder
+#   application/msgpack  the same document in MessagePack (needs the msgpack package)
+#   FRAME                raw little-endian arrays, on endpoints returning numeric series
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+_MSGPACK_ALIASES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+def negotiate(request: Request, frame: bool = False) -> str:
+  """Best encoding the client accepts (by q value, then in the order it lists them)."""
+  accept = request.headers.get("accept", "")
+  best, best_q = JSON, 0.0
+  for part in accept.split(","):
+    fields = [f.strip() for f in part.split(";")]
+    media = fields[0].lower()
+    q = 1.0
+    for f in fields[1:]:
+      if f.startswith("q="):
+        try:
+          q = float(f[2:])
+        except ValueError:
+          q = 0.0
+    if media in _MSGPACK_ALIASES and msgpack is not None:
+      kind = MSGPACK
+    elif media == FRAME and frame:
+      kind = FRAME
+    elif media in (JSON, "application/*", "*/*"):
+      kind = JSON
+    else:
+      continue
+    if q > best_q:
+      best, best_q = kind, q
+  return best
+
+
+def _plain(doc: Any) -> Any:
+  if isinstance(doc, BaseModel):
+    return doc.model_dump(mode = "json")
+  if isinstance(doc, list):
+    return [_plain(x) for x in doc]
+  return doc
+
+
+def doc_response(kind: str, doc: Any) -> Response:
+  """doc (a model, or JSON-able data) as JSON or MessagePack."""
+  headers = {"Vary": "Accept"}
+  if kind == MSGPACK:
+    return Response(content = msgpack.packb(_plain(doc), use_bin_type = True), media_type = MSGPACK, headers = headers)
+  if isinstance(doc, BaseModel):
+    body = doc.model_dump_json()
+  else:
+    body = json.dumps(_plain(doc), separators = (",", ":"))
+  return Response(content = body, media_type = JSON, headers = headers)
+
+
+def frame_response(meta: dict[str, Any], arrays: list[tuple[str, list[int], Iterable[array]]]) -> Response:
+  return Response(content = encode_frame(meta, arrays), media_type = FRAME, headers = {"Vary": "Accept"})
+
+
+def respond(request: Request, doc: Any) -> Response:
+  return doc_response(negotiate(request), doc)
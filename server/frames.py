@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import json
+import struct
+import sys
+from array import array
+from typing import Any, Iterable
+
+
+# Binary API responses (media type FRAME): numeric arrays as raw little-endian
+# bytes behind a small JSON header, so encoding is a memory copy per array and
+# a client maps them with array.frombytes / numpy.frombuffer.
+#
+#   b"ZF1\n", uint32 header length, header (utf-8 JSON), zero padding to 8,
+#   data: the arrays, each starting at a multiple of 8
+#
+#   header = {"meta": {...}, "arrays": [{"name", "dtype", "shape", "offset", "nbytes"}]}
+#
+# offsets are from the start of the data section; dtype is a numpy type string.
+
+FRAME = "application/x-zebra-frame"
+MAGIC = b"ZF1\n"
+_LEN = struct.Struct("<I")
+
+# array typecode <-> dtype
+_DTYPES = {"B": "<u1", "H": "<u2", "I": "<u4", "i": "<i4", "f": "<f4", "d": "<f8"}
+_TYPECODES = {v: k for k, v in _DTYPES.items()}
+
+
+def _pad(n: int) -> int:
+  return -n % 8
+
+
+def _le_bytes(a: array) -> bytes:
+  if sys.byteorder == "big" and a.itemsize > 1:
+    a = array(a.typecode, a)
+    a.byteswap()
+  return a.tobytes()
+
+
+def encode_frame(meta: dict[str, Any], arrays: list[tuple[str, list[int], Iterable[array]]]) -> bytes:
+  """
+  arrays: (name, shape, row-major chunks of one typecode), e.g. a matrix as
+  its rows; chunks are concatenated as they are, without conversion.
+  """
+  specs: list[dict[str, Any]] = []
+  blobs: list[bytes] = []
+  offset = 0
+  for name, shape, chunks in arrays:
+    parts: list[bytes] = []
+    typecode = "B"
+    for chunk in chunks:
+      typecode = chunk.typecode
+      parts.append(_le_bytes(chunk))
+    blob = b"".join(parts)
+    n = 1
+    for dim in shape:
+      n *= dim
+    if len(blob) != n * array(typecode).itemsize:
+      raise ValueError(f"{name}: {len(blob)} bytes do not match shape {shape}")
+    specs.append({"name": name, "dtype": _DTYPES[typecode], "shape": shape, "offset": offset, "nbytes": len(blob)})
+    blobs.append(blob)
+    blobs.append(b"\0" * _pad(len(blob)))
+    offset += len(blob) + _pad(len(blob))
+  header = json.dumps({"meta": meta, "arrays": specs}, separators = (",", ":")).encode("utf-8")
+  head = MAGIC + _LEN.pack(len(header)) + header
+  return b"".join([head, b"\0" * _pad(len(head))] + blobs)
+
+
+def decode_frame(data: bytes) -> tuple[dict[str, Any], dict[str, tuple[list[int], array]]]:
+  """(meta, {name: (shape, flat array)}) of an encoded frame."""
+  if data[:len(MAGIC)] != MAGIC:
+    raise ValueError("not a frame")
+  n = _LEN.unpack_from(data, len(MAGIC))[0]
+  start = len(MAGIC) + _LEN.size
+  header = json.loads(data[start:start + n].decode("utf-8"))
+  base = start + n + _pad(start + n)
+  out: dict[str, tuple[list[int], array]] = {}
+  for spec in header["arrays"]:
+    a = array(_TYPECODES[spec["dtype"]])
+    off = base + spec["offset"]
+    a.frombytes(data[off:off + spec["nbytes"]])
+    if sys.byteorder == "big" and a.itemsize > 1:
+      a.byteswap()
+    out[spec["name"]] = (spec["shape"], a)
+  return header["meta"], out
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from simulator.batch_sim import neighbor_left, neighbor_right
+
+
+# attribute domains as in batch_sim for generated agents
+_DOMAIN = 6
+# consumed feed entries are dropped once there are this many
+_FEED_COMPACT = 1024
+
+
+class GameError(Exception):
+  """Action rejected by the game rules; status is the HTTP code to answer with."""
+
+  def __init__(self, status: int, detail: str) -> None:
+    super().__init__(detail)
+    self.status = status
+    self.detail = detail
+
+
+@dataclass
+class Player:
+  player_id: str
+  house_id: int
+  location: int
+  drink: str
+  smokes: str
+  pet: str
+  # indices into Game.log of the events this player saw; cursor = first unread
+  feed: list[int] = field(default_factory = list)
+  cursor: int = 0
+
+
+class Game:
+  """
+  Interactive session kept in memory, advanced by /tick and player actions.
+
+  Every event is delivered when it happens to the players involved and the
+  players at the houses it touches, so reading a player's state walks only
+  that player's unread feed, and a tick is O(1) whatever the player count.
+  """
+
+  def __init__(self, game_id: str, houses: int = 6) -> None:
+    self.game_id = game_id
+    self.houses = houses
+    self.day = 0
+    self.log: list[dict[str, Any]] = []
+    self.players: dict[str, Player] = {}
+    # location -> players there (dict as an ordered set)
+    self._at: dict[int, dict[str, None]] = {h: {} for h in range(1, houses + 1)}
+    # per-day state, replaced on tick
+    self._acted: set[str] = set()
+    self._offers: dict[tuple[str, int], str] = {}
+    self._lock = threading.Lock()
+
+  def _emit(self, kind: str, houses: tuple[int, ...], involved: tuple[str, ...], **fields: Any) -> dict[str, Any]:
+    ev: dict[str, Any] = {"event_id": len(self.log) + 1, "day": self.day, "type": kind}
+    ev.update(fields)
+    idx = len(self.log)
+    self.log.append(ev)
+    seen: set[str] = set()
+    for pid in involved:
+      seen.add(pid)
+      self.players[pid].feed.append(idx)
+    for h in houses:
+      for pid in self._at[h]:
+        if pid not in seen:
+          seen.add(pid)
+          self.players[pid].feed.append(idx)
+    return ev
+
+  def _player(self, player_id: str) -> Player:
+    # players join on first contact, homes are dealt round-robin
+    p = self.players.get(player_id)
+    if p is None:
+      i = len(self.players)
+      home = (i % self.houses) + 1
+      p = Player(
+        player_id = player_id,
+        house_id = home,
+        location = home,
+        drink = f"d{i % _DOMAIN}",
+        smokes = f"s{i % _DOMAIN}",
+        pet = f"p{i % _DOMAIN}",
+      )
+      self.players[player_id] = p
+      self._emit("join", (home,), (), who = player_id, to_house = home)
+      self._at[home][player_id] = None
+    return p
+
+  def tick(self) -> int:
+    with self._lock:
+      self.day += 1
+      self._acted = set()
+      self._offers = {}
+      return self.day
+
+  def state(self, player_id: str) -> dict[str, Any]:
+    with self._lock:
+      p = self._player(player_id)
+      loc = p.location
+      visible = []
+      for pid in self._at[loc]:
+        if pid == player_id:
+          continue
+        o = self.players[pid]
+        visible.append({"player_id": pid, "house_id": o.house_id, "is_at_home": o.location == o.house_id})
+      return {
+        "day": self.day,
+        "player_id": player_id,
+        "you": {
+          "house_id": str(p.house_id),
+          "location": str(loc),
+          "pet": p.pet,
+          "drink": p.drink,
+          "smokes": p.smokes,
+        },
+        "neighbors": {"left": neighbor_left(loc, self.houses), "right": neighbor_right(loc, self.houses)},
+        "visible_players": visible,
+        "events_since_last_turn": [self.log[i] for i in p.feed[p.cursor:]],
+      }
+
+  def act(self, player_id: str, day: int, kind: str, payload: Optional[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Applies one action of player_id for the current day, returns the events it caused."""
+    payload = payload or {}
+    with self._lock:
+      if day != self.day:
+        raise GameError(409, f"action for day {day}, current day is {self.day}")
+      if player_id in self._acted:
+        raise GameError(409, f"{player_id} already acted on day {day}")
+      p = self._player(player_id)
+      events: list[dict[str, Any]] = []
+
+      if kind == "move":
+        direction = payload.get("direction")
+        src = p.location
+        if direction == "left":
+          dst = neighbor_left(src, self.houses)
+        elif direction == "right":
+          dst = neighbor_right(src, self.houses)
+        elif direction == "home":
+          dst = p.house_id
+        else:
+          raise GameError(422, f"bad direction: {direction}")
+        if dst != src:
+          del self._at[src][player_id]
+          self._at[dst][player_id] = None
+          p.location = dst
+        events.append(self._emit("move", (src, dst), (player_id,), who = player_id, from_house = src, to_house = dst, success = True))
+
+      elif kind == "trade_response":
+        for what, key in (("house", "accept_house_swap"), ("pet", "accept_pet_swap")):
+          if not payload.get(key):
+            continue
+          # a swap needs two players at the same place accepting on the same day
+          loc = p.location
+          other_id = self._offers.pop((what, loc), None)
+          if other_id is None or self.players[other_id].location != loc:
+            self._offers[(what, loc)] = player_id
+            continue
+          other = self.players[other_id]
+          if what == "house":
+            p.house_id, other.house_id = other.house_id, p.house_id
+          else:
+            p.pet, other.pet = other.pet, p.pet
+          events.append(self._emit(
+            f"{what}Exch", (loc,), (player_id, other_id),
+            who1 = player_id, who2 = other_id, success = True,
+          ))
+
+      elif kind != "stay":
+        raise GameError(422, f"bad action type: {kind}")
+
+      self._acted.add(player_id)
+      # the turn is over: what the player saw so far is read
+      p.cursor = len(p.feed)
+      if p.cursor >= _FEED_COMPACT:
+        del p.feed[:p.cursor]
+        p.cursor = 0
+      return events
+
+  def events(self, since: int = 0) -> list[dict[str, Any]]:
+    with self._lock:
+      return self.log[since:]
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+
+class JobQueue:
+  """
+  Simulation jobs on a process pool, one job per session id.
+  on_done(sid, future) is called from the pool's management thread.
+  Workers run initializer once when they start (e.g. to import the engine),
+  and start() brings them all up ahead of the first job.
+  """
+
+  def __init__(
+    self,
+    workers: int | None = None,
+    initializer: Callable[[], None] | None = None,
+  ) -> None:
+    self.workers = workers or os.cpu_count() or 1
+    self.initializer = initializer
+    self._pool: ProcessPoolExecutor | None = None
+    self._futures: dict[str, Future[Any]] = {}
+    self._lock = threading.Lock()
+
+  def _ensure_pool(self) -> ProcessPoolExecutor:
+    if self._pool is None:
+      # spawn: the server process runs threads, forking it is not safe
+      self._pool = ProcessPoolExecutor(
+        max_workers = self.workers,
+        mp_context = multiprocessing.get_context("spawn"),
+        initializer = self.initializer,
+      )
+    return self._pool
+
+  def start(self) -> None:
+    """Spawns every worker now (the pool would start them one per submitted job)."""
+    with self._lock:
+      pool = self._ensure_pool()
+      # each submit finding no idle worker spawns one; the no-op jobs end at once
+      for _ in range(self.workers):
+        pool.submit(_noop)
+
+  def submit(
+    self,
+    sid: str,
+    fn: Callable[..., Any],
+    *args: Any,
+    on_done: Callable[[str, Future[Any]], None],
+  ) -> bool:
+    with self._lock:
+      if sid in self._futures:
+        return False
+      try:
+        fut = self._ensure_pool().submit(fn, *args)
+      except BrokenProcessPool:
+        # a worker died (OOM kill etc.), start over with a fresh pool
+        self._pool = None
+        fut = self._ensure_pool().submit(fn, *args)
+      self._futures[sid] = fut
+
+    def _finish(f: Future[Any]) -> None:
+      try:
+        on_done(sid, f)
+      finally:
+        with self._lock:
+          self._futures.pop(sid, None)
+
+    fut.add_done_callback(_finish)
+    return True
+
+  def cancel(self, sid: str) -> bool:
+    """Drops a job that has not started yet; its on_done sees a cancelled future."""
+    with self._lock:
+      fut = self._futures.get(sid)
+    # outside the lock: on_done runs right here and _finish takes it
+    return fut is not None and fut.cancel()
+
+  def active(self) -> dict[str, str]:
+    """sid -> queued | running of the jobs in flight."""
+    with self._lock:
+      futs = list(self._futures.items())
+    return {sid: "running" if f.running() else "queued" for sid, f in futs if not f.done()}
+
+  def state(self, sid: str) -> str | None:
+    fut = self._futures.get(sid)
+    if fut is None or fut.done():
+      return None
+    return "running" if fut.running() else "queued"
+
+  def counts(self) -> dict[str, int]:
+    with self._lock:
+      futs = list(self._futures.values())
+    running = sum(1 for f in futs if f.running())
+    return {"queued": len(futs) - running, "running": running, "workers": self.workers}
+
+  def shutdown(self) -> None:
+    if self._pool is not None:
+      self._pool.shutdown(wait = False, cancel_futures = True)
+      self._pool = None
+
+
+def _noop() -> None:
+  pass
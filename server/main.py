@@ -1,18 +1,47 @@
 from __future__ import annotations
 
+import asyncio
+import json
+import os
+import sys
+import threading
 import time
 import uuid
+from array import array
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any, Optional
-
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field, ConfigDict
-
-from simulator.engine import run_session
+from typing import Any, AsyncIterator, Literal, Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field, ConfigDict, model_validator
+
+from server.admission import Admission, AdmissionError, estimate_cost
+from server.cache import ResultCache
+from server.downloads import file_response
+from server.encoding import FRAME, doc_response, frame_response, negotiate, respond
+from server.game import Game, GameError
+from server.jobs import JobQueue
+from server.progress import (
+  RunCancelled,
+  cancel_path,
+  last_progress,
+  progress_path,
+  read_progress,
+  run_with_progress,
+  warm_up,
+)
+from server.scores import scores_from_metrics
+from server.store import SessionStore
+from server.telemetry import CONTENT_TYPE, Registry, size_class
+from simulator.artefacts import strip_compress_suffix
+from simulator.metrics_store import MetricsStore, build_from_csv
+from strategy.types import PlayerState
 
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
-LOG_DIR = ROOT_DIR / "data" / "logs"
+LOG_DIR = Path(os.getenv("ZEBRA_LOG_DIR", str(ROOT_DIR / "data" / "logs")))
 
 
 class MTStrategy(BaseModel):
@@ -25,6 +54,18 @@ class MTStrategy(BaseModel):
   p_pet_exch: int = Field(ge = 0, le = 100)
 
 
+class WeightedMTStrategy(MTStrategy):
+  weight: float = Field(gt = 0.0, default = 1.0)
+
+
+class ScoreSpec(BaseModel):
+  model_config = ConfigDict(extra = "forbid")
+
+  who: list[str] = Field(min_length = 1)
+  mode: Literal["final", "mean_tail"] = "final"
+  tail: int = Field(ge = 1, default = 20)
+
+
 class CreateSessionRequest(BaseModel):
   model_config = ConfigDict(extra = "allow")
 
@@ -35,40 +76,282 @@ class CreateSessionRequest(BaseModel):
   share: str = Field(default = "none")
   noise: float = Field(ge = 0.0, le = 1.0, default = 0.0)
   seed: Optional[int] = None
+  # common random numbers: each agent draws from its own fixed slots, so runs
+  # that differ in one agent's strategy share the randomness of all the others
+  crn: bool = False
 
   mt_who: Optional[str] = None
   mt_strategy: Optional[MTStrategy] = None
+  mt_overrides: Optional[dict[str, MTStrategy]] = None
+
+  # write occupancy_<sid>.csv: agents present per house per day
+  occupancy: bool = False
+
+  # time series rows only every K-th day and/or on listed days (last day always)
+  metrics_every: Optional[int] = Field(ge = 1, default = None)
+  metrics_days: Optional[list[int]] = None
+
+  # stream-compress written artefacts (metrics_<sid>.csv.gz, ...)
+  compress: Optional[Literal["gzip", "xz"]] = None
+
+  # seeded sessions may reuse the artefacts of an identical finished run
+  cache: bool = True
+
+  # scores computed by the engine from its in-memory state
+  score: Optional[ScoreSpec] = None
+  # stop the run after this many seconds (counted from its start in a worker);
+  # the session ends as "timeout" with artefacts up to the last simulated day
+  deadline_sec: Optional[float] = Field(gt = 0.0, default = None)
+  # artefacts to write (default csv, xml and metrics); e.g. [] for score-only
+  # optimizer runs. "metrics_store": write the seekable metrics sidecar while
+  # running (uncompressed), instead of building it on the first slice query
+  outputs: Optional[list[Literal["csv", "xml", "metrics", "metrics_store"]]] = None
+
+  # heterogeneous population: round-robin list or weighted distribution
+  strategies: Optional[list[MTStrategy]] = None
+  strategy_mix: Optional[list[WeightedMTStrategy]] = None
+
+  @model_validator(mode = "after")
+  def _check_strategy_sources(self) -> "CreateSessionRequest":
+    if self.strategies and self.strategy_mix:
+      raise ValueError("use either strategies or strategy_mix, not both")
+    return self
 
 
 class CreateSessionResponse(BaseModel):
   session_id: str
+  cached: bool = False
+
+
+class RunResources(BaseModel):
+  wall_sec: float
+  cpu_sec: Optional[float] = None
+  user_sec: Optional[float] = None
+  sys_sec: Optional[float] = None
+  peak_rss_kb: Optional[int] = None
+  io_in_blocks: Optional[int] = None
+  io_out_blocks: Optional[int] = None
+  events: int
+  bytes: dict[str, int]
 
 
 class RunResponse(BaseModel):
+  # created | queued | running | done | failed, or cancelled / timeout
+  # (paths are set once done, and for a run stopped midway)
   status: str
   session_id: str
-  csv: str
-  xml: str
-  metrics: str
-  finished_at: float
+  csv: Optional[str] = None
+  xml: Optional[str] = None
+  metrics: Optional[str] = None
+  occupancy: Optional[str] = None
+  finished_at: Optional[float] = None
+  # days simulated: all of them unless the run was cancelled or timed out
+  days_done: Optional[int] = None
+  scores: Optional[dict[str, float]] = None
+  # measured cost of the run that produced the artefacts (shared by cache hits)
+  resources: Optional[RunResources] = None
+  # last engine progress record while running: day, days, mean_sa, events
+  progress: Optional[dict[str, Any]] = None
+  error: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+  sessions: list[CreateSessionRequest] = Field(min_length = 1, max_length = 1000)
+  score: Optional[ScoreSpec] = None
+
+
+class BatchResponse(BaseModel):
+  batch_id: str
+  session_ids: list[str]
+  cached: list[bool]
+
+
+class BatchStatus(BaseModel):
+  batch_id: str
+  status: str
+  counts: dict[str, int]
 
 
-app = FastAPI(title = "Zebra SA Server")
+class BatchResults(BaseModel):
+  batch_id: str
+  results: list[RunResponse]
 
-_sessions: dict[str, dict[str, Any]] = {}
 
+class ScoreResponse(BaseModel):
+  session_id: str
+  mode: str
+  tail: int
+  scores: dict[str, float]
 
-def _new_sid() -> str:
-  return uuid.uuid4().hex[:12]
 
+class MetricsSlice(BaseModel):
+  session_id: str
+  days: list[int]
+  values: dict[str, list[float]]
+
+
+class CreateGameRequest(BaseModel):
+  houses: int = Field(6, ge = 2)
+
+
+class CreateGameResponse(BaseModel):
+  game_id: str
 
-def _save_session(sid: str, cfg: dict[str, Any]) -> None:
-  _sessions[sid] = {
-    "created_at": time.time(),
-    "cfg": cfg,
-    "done": False,
-    "files": None,
-  }
+
+class TickResponse(BaseModel):
+  game_id: str
+  day: int
+
+
+class ActionRequest(BaseModel):
+  player_id: str
+  day: int
+  type: Literal["move", "stay", "trade_response"]
+  payload: Optional[dict[str, Any]] = None
+
+
+class ActionResponse(BaseModel):
+  status: str
+  events: list[dict[str, Any]]
+
+
+def _default_workers() -> int:
+  # uvicorn --workers N (WEB_CONCURRENCY=N) server processes share the cores
+  return max(1, (os.cpu_count() or 1) // max(1, int(os.getenv("WEB_CONCURRENCY", "1"))))
+
+
+_jobs = JobQueue(int(os.getenv("ZEBRA_WORKERS", "0")) or _default_workers(), initializer = warm_up)
+# shared by every server process using the same ZEBRA_DB and log directory
+# (on hosts sharing a volume: same mount path, ZEBRA_DB_JOURNAL=delete)
+_store = SessionStore(
+  Path(os.getenv("ZEBRA_DB", str(LOG_DIR / "sessions.sqlite3"))),
+  LOG_DIR,
+  ttl_sec = float(os.getenv("ZEBRA_SESSION_TTL_H", "168")) * 3600.0,
+  max_sessions = int(os.getenv("ZEBRA_MAX_SESSIONS", "100000")),
+  max_bytes = int(os.getenv("ZEBRA_LOGS_MAX_MB", os.getenv("ZEBRA_CACHE_MAX_MB", "2048"))) * 1024 * 1024,
+  journal = os.getenv("ZEBRA_DB_JOURNAL", "wal"),
+)
+_cache = ResultCache(_store)
+# admission in agent-days weighted by outputs (see server.admission.estimate_cost);
+# the default queue holds about 10 minutes of work at the engine's base rate
+_admission = Admission(
+  _jobs.workers,
+  max_queue_cost = float(os.getenv("ZEBRA_MAX_QUEUE_COST", str(_jobs.workers * 5e8))),
+  max_session_cost = float(os.getenv("ZEBRA_MAX_SESSION_COST", "2e9")),
+  max_client_inflight = int(os.getenv("ZEBRA_CLIENT_MAX_INFLIGHT", "256")),
+)
+# upper bound of every run's deadline_sec (0: runs without one are not bounded)
+_MAX_RUN_SEC = float(os.getenv("ZEBRA_MAX_RUN_SEC", "0"))
+
+
+async def _housekeeping() -> None:
+  # keeps this process alive in the registry, fails jobs of processes that died
+  while True:
+    await asyncio.sleep(_store.heartbeat_sec)
+    try:
+      await asyncio.to_thread(_store.heartbeat)
+      await asyncio.to_thread(_store.reap)
+      await asyncio.to_thread(_store.maybe_evict)
+    except Exception as e:
+      print(f"housekeeping: {type(e).__name__}: {e}", file = sys.stderr)
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI) -> AsyncIterator[None]:
+  # jobs of a previous process died with it; files nobody references are dropped
+  _store.reap()
+  _store.evict()
+  _store.sweep_orphans()
+  # workers up (engine imported) before the first run is submitted
+  _jobs.start()
+  task = asyncio.create_task(_housekeeping())
+  yield
+  task.cancel()
+  _jobs.shutdown()
+  _store.release_owner()
+
+
+app = FastAPI(title = "Zebra SA Server", lifespan = _lifespan)
+
+# runtime metrics, served by GET /metrics
+_telemetry = Registry()
+_http_requests = _telemetry.counter(
+  "zebra_http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"),
+)
+_http_latency = _telemetry.histogram(
+  "zebra_http_request_duration_seconds", "Time to the response headers by route.",
+  [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0], ("method", "route"),
+)
+_runs_finished = _telemetry.counter(
+  "zebra_sessions_finished_total", "Simulation jobs that ended, by outcome.", ("status",),
+)
+_run_seconds = _telemetry.histogram(
+  "zebra_session_run_seconds", "Wall time of finished runs by agents x days (rounded up to a power of ten).",
+  [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0], ("size",),
+)
+_engine_events = _telemetry.counter("zebra_engine_events_total", "Events simulated by finished runs.")
+_engine_seconds = _telemetry.counter("zebra_engine_seconds_total", "Wall time spent in finished runs.")
+_engine_eps = _telemetry.histogram(
+  "zebra_engine_events_per_second", "Event throughput of finished runs.",
+  [1e3, 1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7],
+)
+_artefact_bytes = _telemetry.counter(
+  "zebra_artefact_bytes_total", "Bytes written per artefact type.", ("kind",),
+)
+_artefact_size = _telemetry.histogram(
+  "zebra_artefact_size_bytes", "Size of written artefacts per type.",
+  [float(4 ** k * 1024) for k in range(12)], ("kind",),
+)
+_telemetry.gauge(
+  "zebra_jobs", "Simulation jobs in the pool by state.",
+  lambda: [((k,), float(v)) for k, v in _jobs.counts().items() if k != "workers"], ("state",),
+)
+_telemetry.gauge("zebra_workers", "Worker processes of the pool.", lambda: [((), float(_jobs.workers))])
+_telemetry.gauge(
+  "zebra_worker_utilisation", "Running jobs per worker.",
+  lambda: [((), _jobs.counts()["running"] / float(_jobs.workers))],
+)
+_telemetry.gauge(
+  "zebra_admission_queued_cost", "Estimated cost of admitted queued and running sessions.",
+  lambda: [((), _admission.stats()["queued_cost"])],
+)
+_telemetry.counter_func(
+  "zebra_admission_rejected_total", "Runs refused by admission control.",
+  lambda: [((), float(_admission.stats()["rejected"]))],
+)
+_telemetry.counter_func(
+  "zebra_cache_lookups_total", "Result cache lookups by outcome.",
+  lambda: [(("hit",), float(_cache.hits)), (("miss",), float(_cache.misses))], ("result",),
+)
+_telemetry.gauge(
+  "zebra_store_sessions", "Sessions in the registry by status.",
+  lambda: [((k,), float(v)) for k, v in _store.stats()["sessions"].items()], ("status",),
+)
+_telemetry.gauge("zebra_store_bytes", "Bytes of artefacts the registry keeps.", lambda: [((), float(_store.stats()["bytes"]))])
+
+
+@app.middleware("http")
+async def _observe_requests(request: Request, call_next: Any) -> Response:
+  t0 = time.perf_counter()
+  status = 500
+  try:
+    response = await call_next(request)
+    status = response.status_code
+    return response
+  finally:
+    # route template, not the raw path: sids would explode the label set
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    _http_requests.inc((request.method, route, str(status)))
+    _http_latency.observe(time.perf_counter() - t0, (request.method, route))
+
+
+# interactive games live in memory only (per server process: with several,
+# game traffic must stick to one of them); the runner talks to "default"
+_games: dict[str, Game] = {"default": Game("default")}
+
+
+def _new_sid() -> str:
+  return uuid.uuid4().hex[:12]
 
 
 def _normalize_cfg(req: CreateSessionRequest) -> dict[str, Any]:
@@ -88,52 +371,532 @@ def create_session_alt(req: CreateSessionRequest) -> CreateSessionResponse:
   return create_session(req)
 
 
-@app.post("/session/create", response_model=CreateSessionResponse)
-def create_session(req: CreateSessionRequest) -> CreateSessionResponse:
-  LOG_DIR.mkdir(parents = True, exist_ok = True)
-  sid = _new_sid()
+def _prepare(req: CreateSessionRequest) -> tuple[str, dict[str, Any], str | None, dict[str, Any] | None]:
+  # (sid, cfg, cache key, cached files) of a session not stored yet
   cfg = _normalize_cfg(req)
-  _save_session(sid, cfg)
-  return CreateSessionResponse(session_id = sid)
+  key = _cache.key(cfg) if req.cache else None
+  files = _cache.get(key) if key is not None else None
+  return _new_sid(), cfg, key, files
 
 
-def _run_and_return(sid: str) -> RunResponse:
-  if sid not in _sessions:
-    raise HTTPException(status_code = 404, detail = "unknown session_id")
-
-  s = _sessions[sid]
-  if s["done"] and s["files"] is not None:
-    files = s["files"]
+@app.post("/session/create", response_model=CreateSessionResponse)
+def create_session(req: CreateSessionRequest) -> CreateSessionResponse:
+  LOG_DIR.mkdir(parents = True, exist_ok = True)
+  sid, cfg, key, files = _prepare(req)
+  _store.create(sid, cfg, key, files)
+  _store.maybe_evict()
+  return CreateSessionResponse(session_id = sid, cached = files is not None)
+
+
+def _session_response(sid: str) -> RunResponse:
+  s = _store.get(sid)
+  if s is None:
+    # evicted while a batch still lists it
+    return RunResponse(status = "evicted", session_id = sid)
+  files = s["files"]
+  if files is None:
+    status = _jobs.state(sid) or s["status"]
+    if status == "queued" and progress_path(LOG_DIR, sid).exists():
+      # started by a worker of another server process
+      status = "running"
     return RunResponse(
-      status="done",
+      status = status,
       session_id = sid,
-      csv = str(files["csv"]),
-      xml = str(files["xml"]),
-      metrics = str(files["metrics"]),
-      finished_at = float(files["finished_at"]),
+      progress = last_progress(progress_path(LOG_DIR, sid)) if status == "running" else None,
+      error = s["error"],
     )
 
-  cfg = dict(s["cfg"])
-  files = run_session(session_id = sid, cfg = cfg, log_dir = LOG_DIR)
-
-  s["done"] = True
-  s["files"] = files
+  def _path(key: str) -> Optional[str]:
+    return str(files[key]) if files.get(key) else None
 
   return RunResponse(
-    status = "done",
+    status = s["status"],
     session_id = sid,
-    csv = str(files["csv"]),
-    xml = str(files["xml"]),
-    metrics = str(files["metrics"]),
+    csv = _path("csv"),
+    xml = _path("xml"),
+    metrics = _path("metrics"),
+    occupancy = _path("occupancy"),
     finished_at = float(files["finished_at"]),
+    days_done = files.get("days_done"),
+    scores = files.get("scores"),
+    resources = files.get("resources"),
+  )
+
+
+def _session_scores(sid: str, spec: ScoreSpec) -> dict[str, float]:
+  # engine-computed scores when the session asked for the same spec,
+  # otherwise from the tail of the metrics file
+  s = _get_session(sid)
+  files = s["files"]
+  own = s["cfg"].get("score")
+  if files.get("scores") is not None and own is not None:
+    if own["mode"] == spec.mode and (spec.mode == "final" or own["tail"] == spec.tail):
+      if all(w in files["scores"] for w in spec.who):
+        return {w: files["scores"][w] for w in spec.who}
+  if not files.get("metrics"):
+    raise ValueError("session has no metrics file and no matching engine score")
+  return scores_from_metrics(files["metrics"], spec.who, spec.mode, spec.tail)
+
+
+def _on_job_done(sid: str, fut: Future[Any]) -> None:
+  cancel_path(LOG_DIR, sid).unlink(missing_ok = True)
+  err = None if fut.cancelled() else fut.exception()
+  if fut.cancelled() or isinstance(err, RunCancelled):
+    # cancelled before it started
+    _admission.release(sid)
+    _store.cancel(sid)
+    _runs_finished.inc(("cancelled",))
+  elif err is not None:
+    _admission.release(sid)
+    _store.fail(sid, f"{type(err).__name__}: {err}")
+    _runs_finished.inc(("failed",))
+  else:
+    files = fut.result()
+    # cancelled / timeout: the engine stopped early, the status says why
+    interrupted = files.pop("interrupted", None)
+    status = interrupted or "done"
+    # a partial run's wall time says nothing about the rate of a full one
+    _admission.release(sid, None if interrupted else files["resources"]["wall_sec"])
+    _store.finish(sid, files, status)
+    _observe_run(sid, files, status)
+  _store.maybe_evict()
+
+
+def _observe_run(sid: str, files: dict[str, Any], status: str) -> None:
+  _runs_finished.inc((status,))
+  s = _store.get(sid)
+  res = files["resources"]
+  wall = res["wall_sec"]
+  if s is not None and wall > 0:
+    cfg = s["cfg"]
+    _run_seconds.observe(wall, (size_class(int(cfg.get("agents", 1000)), int(cfg.get("days", 200))),))
+    _engine_events.inc(v = res["events"])
+    _engine_seconds.inc(v = wall)
+    _engine_eps.observe(res["events"] / wall)
+  for kind, size in res["bytes"].items():
+    _artefact_bytes.inc((kind,), size)
+    _artefact_size.observe(size, (kind,))
+
+
+def _get_session(sid: str) -> dict[str, Any]:
+  s = _store.get(sid)
+  if s is None:
+    raise HTTPException(status_code = 404, detail = "unknown session_id")
+  return s
+
+
+def _client_id(request: Request) -> str:
+  # per-client limits: an explicit id, else the peer address
+  return request.headers.get("x-client-id") or (request.client.host if request.client else "unknown")
+
+
+def _admit(client: str, items: list[tuple[str, float]]) -> list[str]:
+  try:
+    return _admission.admit(client, items)
+  except AdmissionError as e:
+    if e.retry_after is None:
+      raise HTTPException(status_code = 422, detail = e.detail)
+    raise HTTPException(
+      status_code = 429,
+      detail = e.detail,
+      headers = {"Retry-After": str(int(e.retry_after))},
+    )
+
+
+def _submit(sid: str, cfg: dict[str, Any]) -> None:
+  # the session is admitted; another request may have started it meanwhile
+  if _store.mark_queued(sid):
+    deadline = cfg.get("deadline_sec")
+    if _MAX_RUN_SEC > 0:
+      deadline = min(deadline or _MAX_RUN_SEC, _MAX_RUN_SEC)
+    _jobs.submit(sid, run_with_progress, sid, dict(cfg), LOG_DIR, deadline, on_done = _on_job_done)
+  else:
+    _admission.release(sid)
+
+
+def _enqueue_and_return(sid: str, client: str) -> RunResponse:
+  s = _get_session(sid)
+  # a concurrent /run of the same session holds its admission and submits it
+  if s["status"] == "created" and _admit(client, [(sid, estimate_cost(s["cfg"]))]):
+    _submit(sid, s["cfg"])
+  return _session_response(sid)
+
+
+@app.post("/sessions/batch", response_model=BatchResponse)
+def create_batch(req: BatchRequest, request: Request) -> BatchResponse:
+  LOG_DIR.mkdir(parents = True, exist_ok = True)
+  prepared = []
+  for item in req.sessions:
+    if req.score is not None and item.score is None:
+      item = item.model_copy(update = {"score": req.score})
+    prepared.append(_prepare(item))
+  todo = [(sid, cfg) for sid, cfg, _, files in prepared if files is None]
+
+  # the batch is admitted as a whole before anything is stored: a refused
+  # batch leaves no sessions behind for its retry to duplicate
+  _admit(_client_id(request), [(sid, estimate_cost(cfg)) for sid, cfg in todo])
+  try:
+    for sid, cfg, key, files in prepared:
+      _store.create(sid, cfg, key, files)
+  except Exception:
+    for sid, _ in todo:
+      _admission.release(sid)
+    raise
+  _store.maybe_evict()
+  for sid, cfg in todo:
+    _submit(sid, cfg)
+
+  sids = [sid for sid, _, _, _ in prepared]
+  cached = [files is not None for _, _, _, files in prepared]
+  bid = _new_sid()
+  _store.add_batch(bid, sids, req.score.model_dump() if req.score is not None else None)
+  return BatchResponse(batch_id = bid, session_ids = sids, cached = cached)
+
+
+# terminal session states as a batch sees them
+_FINISHED = ("done", "failed", "cancelled", "timeout", "evicted")
+
+
+def _get_batch(bid: str) -> dict[str, Any]:
+  b = _store.get_batch(bid)
+  if b is None:
+    raise HTTPException(status_code = 404, detail = "unknown batch_id")
+  return b
+
+
+def _batch_counts(b: dict[str, Any]) -> dict[str, int]:
+  counts: dict[str, int] = {}
+  for sid in b["sids"]:
+    st = _session_response(sid).status
+    counts[st] = counts.get(st, 0) + 1
+  return counts
+
+
+@app.get("/sessions/batch/{bid}", response_model=BatchStatus)
+def batch_status(bid: str) -> BatchStatus:
+  counts = _batch_counts(_get_batch(bid))
+  pending = sum(n for st, n in counts.items() if st not in _FINISHED)
+  if pending == 0:
+    status = "done"
+  elif counts.get("running", 0) > 0 or counts.get("done", 0) + counts.get("failed", 0) > 0:
+    status = "running"
+  else:
+    status = "queued"
+  return BatchStatus(batch_id = bid, status = status, counts = counts)
+
+
+@app.get("/sessions/batch/{bid}/results", response_model=BatchResults)
+def batch_results(bid: str, request: Request) -> Response:
+  b = _get_batch(bid)
+  results = [_session_response(sid) for sid in b["sids"]]
+  if any(r.status not in _FINISHED for r in results):
+    raise HTTPException(status_code = 409, detail = "batch not finished")
+
+  spec = ScoreSpec(**b["score"]) if b["score"] is not None else None
+  if spec is not None:
+    for r in results:
+      if r.status != "done":
+        continue
+      try:
+        r.scores = _session_scores(r.session_id, spec)
+      except (OSError, ValueError) as e:
+        r.error = f"score: {e}"
+  return respond(request, BatchResults(batch_id = bid, results = results))
+
+
+@app.get("/metrics")
+def runtime_metrics() -> Response:
+  return Response(content = _telemetry.render(), media_type = CONTENT_TYPE)
+
+
+@app.get("/queue")
+def queue_stats() -> dict[str, Any]:
+  return {"jobs": _jobs.counts(), "admission": _admission.stats()}
+
+
+@app.get("/sessions/active")
+def active_sessions() -> list[dict[str, Any]]:
+  """Queued and running sessions for operators: who submitted them, cost, age, progress."""
+  now = time.time()
+  jobs = _jobs.active()
+  inflight = _admission.inflight()
+  out: list[dict[str, Any]] = []
+  for row in _store.list_active():
+    sid = row["sid"]
+    cfg = row["cfg"]
+    # jobs of other server processes: running once they write progress
+    status = jobs.get(sid) or ("running" if progress_path(LOG_DIR, sid).exists() else row["status"])
+    client, cost = inflight.get(sid, (None, estimate_cost(cfg)))
+    out.append({
+      "session_id": sid,
+      "status": status,
+      "client": client,
+      "owner": row["owner"],
+      "cost": cost,
+      "agents": cfg.get("agents"),
+      "days": cfg.get("days"),
+      "deadline_sec": cfg.get("deadline_sec"),
+      "age_sec": now - row["started_at"] if row["started_at"] else None,
+      "progress": last_progress(progress_path(LOG_DIR, sid)) if status == "running" else None,
+    })
+  return out
+
+
+@app.get("/cache")
+def cache_stats() -> dict[str, Any]:
+  return _cache.stats()
+
+
+@app.get("/session/{sid}", response_model=RunResponse)
+def session_status(sid: str) -> RunResponse:
+  _get_session(sid)
+  return _session_response(sid)
+
+
+@app.get("/session/{sid}/score", response_model=ScoreResponse)
+def session_score(
+  sid: str,
+  who: str = "a0",
+  mode: Literal["final", "mean_tail"] = "final",
+  tail: int = 20,
+) -> ScoreResponse:
+  s = _get_session(sid)
+  if s["files"] is None:
+    raise HTTPException(status_code = 409, detail = f"session is {_session_response(sid).status}")
+  spec = ScoreSpec(who = [w for w in who.split(",") if w], mode = mode, tail = tail)
+  try:
+    scores = _session_scores(sid, spec)
+  except (OSError, ValueError) as e:
+    raise HTTPException(status_code = 422, detail = str(e))
+  return ScoreResponse(session_id = sid, mode = spec.mode, tail = spec.tail, scores = scores)
+
+
+_ARTEFACT_TYPES = {
+  "csv": "text/csv",
+  "xml": "application/xml",
+  "metrics": "text/csv",
+  "occupancy": "text/csv",
+}
+
+
+def _artefact_response(request: Request, sid: str, kind: str) -> Response:
+  s = _get_session(sid)
+  if s["files"] is None:
+    raise HTTPException(status_code = 409, detail = f"session is {_session_response(sid).status}")
+  name = s["files"].get(kind)
+  if not name:
+    raise HTTPException(status_code = 404, detail = f"session has no {kind} artefact")
+  path = Path(name)
+  if not path.is_file():
+    raise HTTPException(status_code = 410, detail = f"{kind} artefact is gone")
+  return file_response(request, path, _ARTEFACT_TYPES[kind], strip_compress_suffix(path.name))
+
+
+@app.get("/session/{sid}/log/csv")
+def session_log_csv(sid: str, request: Request) -> Response:
+  return _artefact_response(request, sid, "csv")
+
+
+@app.get("/session/{sid}/log/xml")
+def session_log_xml(sid: str, request: Request) -> Response:
+  return _artefact_response(request, sid, "xml")
+
+
+# one build of a session's metrics store at a time
+_store_builds: dict[str, threading.Lock] = {}
+_store_builds_lock = threading.Lock()
+
+
+def _metrics_store(sid: str) -> Path:
+  # built from the metrics file on first use, unless the run wrote it (outputs "metrics_store")
+  s = _store.get(sid)
+  files = s["files"]
+  if files.get("metrics_bin") and Path(files["metrics_bin"]).is_file():
+    return Path(files["metrics_bin"])
+  if not files.get("metrics"):
+    raise HTTPException(status_code = 404, detail = "session has no metrics artefact")
+  src = Path(files["metrics"])
+  dst = src.with_name(Path(strip_compress_suffix(src.name)).stem + ".bin")
+  with _store_builds_lock:
+    lock = _store_builds.setdefault(sid, threading.Lock())
+  try:
+    with lock:
+      if not dst.is_file():
+        build_from_csv(src, dst, int(s["cfg"].get("houses", 6)) * 5)
+  finally:
+    with _store_builds_lock:
+      _store_builds.pop(sid, None)
+  files["metrics_bin"] = str(dst)
+  _store.update_files(sid, files)
+  return dst
+
+
+def _metrics_cols(agents: str | None, n: int) -> list[int] | None:
+  if agents is None:
+    return None
+  cols: list[int] = []
+  for name in (x.strip() for x in agents.split(",")):
+    if not name:
+      continue
+    if name[:1] != "a" or not name[1:].isdigit() or int(name[1:]) >= n:
+      raise HTTPException(status_code = 422, detail = f"unknown agent: {name}")
+    cols.append(int(name[1:]))
+  return cols
+
+
+@app.get("/session/{sid}/metrics", response_model=None)
+def session_metrics(
+  sid: str,
+  request: Request,
+  agents: Optional[str] = None,
+  day_from: int = Query(1, alias = "from", ge = 1),
+  day_to: Optional[int] = Query(None, alias = "to", ge = 1),
+  every: int = Query(1, ge = 1),
+) -> Response:
+  # no query and no binary encoding asked for: the metrics file itself;
+  # otherwise a slice read from the store
+  kind = negotiate(request, frame = True)
+  if not request.query_params and kind == "application/json":
+    return _artefact_response(request, sid, "metrics")
+
+  s = _get_session(sid)
+  if s["files"] is None:
+    raise HTTPException(status_code = 409, detail = f"session is {_session_response(sid).status}")
+  try:
+    store = MetricsStore(_metrics_store(sid))
+  except (OSError, ValueError) as e:
+    raise HTTPException(status_code = 422, detail = str(e))
+  with store:
+    cols = _metrics_cols(agents, store.agents)
+    days, rows = store.read_known(cols, day_from, day_to, every)
+    total = store.total_facts
+    n = store.agents
+
+  names = [f"a{i}" for i in (range(n) if cols is None else cols)]
+  if kind == FRAME:
+    # the stored counts as they are: M1 = known * scale
+    return frame_response(
+      {"session_id": sid, "agents": names, "total_facts": total, "scale": 1.0 / total},
+      [("days", [len(days)], [array("I", days)]), ("known", [len(days), len(names)], rows)],
+    )
+  # counts are 0..total_facts: one rounded M1 per possible count
+  m1 = [round(k / float(total), 6) for k in range(total + 1)]
+  values = {name: [m1[vals[j]] for vals in rows] for j, name in enumerate(names)}
+  return doc_response(kind, MetricsSlice(session_id = sid, days = days, values = values))
+
+
+@app.get("/session/{sid}/occupancy")
+def session_occupancy(sid: str, request: Request) -> Response:
+  return _artefact_response(request, sid, "occupancy")
+
+
+async def _progress_stream(sid: str, poll_sec: float = 0.25) -> AsyncIterator[dict[str, Any]]:
+  # follows progress_<sid>.jsonl, ends with {"status": <one of _FINISHED>}
+  path = progress_path(LOG_DIR, sid)
+  pos = 0
+  while True:
+    status = _session_response(sid).status
+    recs, pos = read_progress(path, pos)
+    for rec in recs:
+      yield rec
+    if status in _FINISHED:
+      s = _store.get(sid)
+      yield {"status": status, "error": s["error"] if s is not None else None}
+      return
+    await asyncio.sleep(poll_sec)
+
+
+@app.get("/session/{sid}/progress")
+async def session_progress_sse(sid: str) -> StreamingResponse:
+  _get_session(sid)
+
+  async def events() -> AsyncIterator[str]:
+    async for rec in _progress_stream(sid):
+      kind = "end" if "status" in rec else "progress"
+      yield f"event: {kind}\ndata: {json.dumps(rec)}\n\n"
+
+  return StreamingResponse(
+    events(),
+    media_type = "text/event-stream",
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
   )
 
 
+@app.websocket("/session/{sid}/progress/ws")
+async def session_progress_ws(ws: WebSocket, sid: str) -> None:
+  await ws.accept()
+  if _store.get(sid) is None:
+    await ws.close(code = 4404, reason = "unknown session_id")
+    return
+  try:
+    async for rec in _progress_stream(sid):
+      await ws.send_json(rec)
+    await ws.close()
+  except WebSocketDisconnect:
+    pass
+
+
 @app.post("/session/{sid}/run", response_model=RunResponse)
-def run_session_endpoint(sid: str) -> RunResponse:
-  return _run_and_return(sid)
+def run_session_endpoint(sid: str, request: Request) -> RunResponse:
+  return _enqueue_and_return(sid, _client_id(request))
 
 
 @app.post("/session/{sid}/start", response_model=RunResponse)
-def start_session_endpoint(sid: str) -> RunResponse:
-  return _run_and_return(sid)
+def start_session_endpoint(sid: str, request: Request) -> RunResponse:
+  return _enqueue_and_return(sid, _client_id(request))
+
+
+@app.delete("/session/{sid}", response_model=RunResponse)
+def cancel_session(sid: str) -> RunResponse:
+  """
+  Cancels a session that is not finished: a queued job is dropped, a running one
+  stops at the next day boundary and keeps the artefacts written so far.
+  Finished sessions are left as they are.
+  """
+  s = _get_session(sid)
+  if s["status"] == "created":
+    if _store.cancel(sid):
+      _runs_finished.inc(("cancelled",))
+  elif s["status"] in ("queued", "running"):
+    # the flag reaches the job in any worker and any server process
+    cancel_path(LOG_DIR, sid).touch()
+    _jobs.cancel(sid)
+  return _session_response(sid)
+
+
+def _get_game(game_id: str) -> Game:
+  g = _games.get(game_id)
+  if g is None:
+    raise HTTPException(status_code = 404, detail = "unknown game_id")
+  return g
+
+
+@app.post("/game", response_model=CreateGameResponse)
+def create_game(req: CreateGameRequest) -> CreateGameResponse:
+  gid = _new_sid()
+  _games[gid] = Game(gid, houses = req.houses)
+  return CreateGameResponse(game_id = gid)
+
+
+@app.post("/tick", response_model=TickResponse)
+def game_tick(game: str = "default") -> TickResponse:
+  return TickResponse(game_id = game, day = _get_game(game).tick())
+
+
+@app.get("/state/{player_id}", response_model=PlayerState)
+def game_state(player_id: str, request: Request, game: str = "default") -> Response:
+  return respond(request, PlayerState.model_validate(_get_game(game).state(player_id)))
+
+
+@app.post("/action", response_model=ActionResponse)
+def game_action(req: ActionRequest, game: str = "default") -> ActionResponse:
+  try:
+    events = _get_game(game).act(req.player_id, req.day, req.type, req.payload)
+  except GameError as e:
+    raise HTTPException(status_code = e.status, detail = e.detail)
+  return ActionResponse(status = "ok", events = events)
+
+
+@app.get("/log")
+def game_log(request: Request, game: str = "default", since: int = Query(0, ge = 0)) -> Response:
+  return respond(request, _get_game(game).events(since))
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+from typing import Any
+
+from simulator.engine import run_session
+
+
+class ProgressWriter:
+  """Engine progress callback: one JSON line per update, readable by any server process."""
+
+  def __init__(self, path: Path) -> None:
+    self.path = path
+    self.path.write_text("", encoding = "utf-8")
+
+  def __call__(self, rec: dict[str, Any]) -> None:
+    rec = dict(rec, t = time.time())
+    with self.path.open("a", encoding = "utf-8") as f:
+      f.write(json.dumps(rec) + "\n")
+
+
+class RunCancelled(Exception):
+  """The session was cancelled before its job started."""
+
+
+class StopCheck:
+  """
+  Engine stop callback: "timeout" once deadline_sec have passed since the job
+  started, "cancelled" once the cancel flag file exists (polled every poll_sec,
+  so any server process can cancel a run by creating it).
+  """
+
+  def __init__(self, flag: Path, deadline_sec: float | None, poll_sec: float = 0.1) -> None:
+    self.flag = flag
+    self.deadline = time.monotonic() + deadline_sec if deadline_sec else None
+    self.poll_sec = poll_sec
+    self._next_poll = 0.0
+
+  def __call__(self) -> str | None:
+    now = time.monotonic()
+    if self.deadline is not None and now >= self.deadline:
+      return "timeout"
+    if now >= self._next_poll:
+      self._next_poll = now + self.poll_sec
+      if self.flag.exists():
+        return "cancelled"
+    return None
+
+
+def progress_path(log_dir: Path, sid: str) -> Path:
+  return log_dir / f"progress_{sid}.jsonl"
+
+
+def cancel_path(log_dir: Path, sid: str) -> Path:
+  return log_dir / f"cancel_{sid}.flag"
+
+
+def warm_up() -> None:
+  """Pool worker initializer: the engine is imported with this module, nothing else to do."""
+
+
+def run_with_progress(
+  sid: str,
+  cfg: dict[str, Any],
+  log_dir: Path,
+  deadline_sec: float | None = None,
+) -> dict[str, Any]:
+  """Pool job: run_session publishing its progress next to the artefacts, stoppable."""
+  flag = cancel_path(log_dir, sid)
+  if flag.exists():
+    raise RunCancelled(sid)
+  return run_session(
+    sid, cfg, log_dir,
+    progress = ProgressWriter(progress_path(log_dir, sid)),
+    stop = StopCheck(flag, deadline_sec),
+  )
+
+
+def read_progress(path: Path, pos: int) -> tuple[list[dict[str, Any]], int]:
+  """Complete records appended after byte offset pos, and the new offset."""
+  try:
+    with path.open("rb") as f:
+      f.seek(pos)
+      chunk = f.read()
+  except OSError:
+    return [], pos
+  end = chunk.rfind(b"\n")
+  if end < 0:
+    return [], pos
+  recs = [json.loads(line) for line in chunk[:end].splitlines() if line.strip()]
+  return recs, pos + end + 1
+
+
+def last_progress(path: Path) -> dict[str, Any] | None:
+  try:
+    with path.open("rb") as f:
+      f.seek(0, 2)
+      f.seek(max(0, f.tell() - 4096))
+      tail = f.read()
+  except OSError:
+    return None
+  lines = tail.split(b"\n")
+  # the last element is "" or a line still being written
+  for line in reversed(lines[:-1]):
+    try:
+      return json.loads(line)
+    except ValueError:
+      continue
+  return None
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import csv
+import os
+from collections import deque
+
+from simulator.artefacts import open_artefact
+from simulator.engine import score_values
+
+
+def scores_from_metrics(
+  metrics_path: str | os.PathLike[str],
+  whos: list[str],
+  mode: str,
+  tail: int,
+) -> dict[str, float]:
+  """Scores for agent columns of a finished metrics file (only the tail rows are kept)."""
+  keep = 1 if mode == "final" else max(1, tail)
+  with open_artefact(metrics_path, "r", encoding = "utf-8", newline = "") as f:
+    r = csv.reader(f)
+    header = next(r, None)
+    if not header or header[0] != "day":
+      raise ValueError(f"bad metrics header: {header[:10] if header else header}")
+    cols: list[int] = []
+    for who in whos:
+      if who not in header:
+        raise ValueError(f"no column '{who}' in metrics")
+      cols.append(header.index(who))
+    rows: deque[list[str]] = deque(r, maxlen = keep)
+
+  return {
+    who: score_values([float(row[c]) for row in rows], mode, tail)
+    for who, c in zip(whos, cols)
+  }
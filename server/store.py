@@ -0,0 +1,495 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Iterable
+
+from server.progress import progress_path
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+  sid TEXT PRIMARY KEY,
+  created_at REAL NOT NULL,
+  started_at REAL,
+  finished_at REAL,
+  last_used REAL NOT NULL,
+  status TEXT NOT NULL,
+  cfg TEXT NOT NULL,
+  files TEXT,
+  error TEXT,
+  cache_key TEXT,
+  owner TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions(last_used);
+CREATE INDEX IF NOT EXISTS sessions_cache_key ON sessions(cache_key);
+CREATE INDEX IF NOT EXISTS sessions_status ON sessions(status);
+CREATE TABLE IF NOT EXISTS artefacts (
+  sid TEXT NOT NULL,
+  path TEXT NOT NULL,
+  bytes INTEGER NOT NULL,
+  PRIMARY KEY (sid, path)
+);
+CREATE INDEX IF NOT EXISTS artefacts_path ON artefacts(path);
+CREATE TABLE IF NOT EXISTS batches (
+  bid TEXT PRIMARY KEY,
+  created_at REAL NOT NULL,
+  sids TEXT NOT NULL,
+  score TEXT
+);
+CREATE INDEX IF NOT EXISTS batches_created_at ON batches(created_at);
+CREATE TABLE IF NOT EXISTS owners (
+  owner TEXT PRIMARY KEY,
+  host TEXT NOT NULL,
+  pid INTEGER NOT NULL,
+  started_at REAL NOT NULL,
+  heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+  key TEXT PRIMARY KEY,
+  value TEXT NOT NULL
+);
+"""
+
+# sessions in these states have a job in flight and are never evicted
+_ACTIVE = ("queued", "running")
+
+# files the engine / server write per session
+_ARTEFACT_RE = re.compile(r"^(?:game|metrics|occupancy|progress|cancel)_([0-9a-f]{12})\.")
+
+
+def _file_paths(files: dict[str, Any] | None) -> list[str]:
+  if not files:
+    return []
+  return [str(v) for v in files.values() if isinstance(v, (str, Path))]
+
+
+def _jsonable(files: dict[str, Any] | None) -> str | None:
+  if files is None:
+    return None
+  return json.dumps({k: (str(v) if isinstance(v, Path) else v) for k, v in files.items()})
+
+
+def _pid_alive(pid: int) -> bool:
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except OSError:
+    # exists, owned by someone else
+    return True
+  return True
+
+
+def _file_size(path: str) -> int:
+  try:
+    return os.path.getsize(path)
+  except OSError:
+    return 0
+
+
+class SessionStore:
+  """
+  Session registry in SQLite: config, status, artefact paths and sizes, timings.
+  Finished sessions expire after ttl_sec of not being used, and the oldest are
+  dropped while there are more than max_sessions or their files take more than
+  max_bytes. Artefacts are reference counted (cache hits share the files of the
+  run that produced them) and deleted with the last session that uses them.
+
+  Any number of server processes, on this host or on hosts sharing the volume,
+  can use the same database: each one is an owner that heartbeats, sessions
+  record the owner running their job, and the jobs of an owner that stopped
+  heartbeating (or whose pid is gone on this host) are failed by the others.
+  WAL needs the processes on one host; over a network volume use journal="delete".
+  """
+
+  def __init__(
+    self,
+    db_path: Path,
+    log_dir: Path,
+    ttl_sec: float,
+    max_sessions: int,
+    max_bytes: int,
+    evict_every_sec: float = 30.0,
+    heartbeat_sec: float = 10.0,
+    journal: str = "wal",
+  ) -> None:
+    self.db_path = db_path
+    self.log_dir = log_dir
+    self.ttl_sec = ttl_sec
+    self.max_sessions = max_sessions
+    self.max_bytes = max_bytes
+    self.evict_every_sec = evict_every_sec
+    self.heartbeat_sec = heartbeat_sec
+    self.host = socket.gethostname()
+    self.owner = f"{self.host}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    self.evictions = 0
+    self._next_evict = 0.0
+    self._lock = threading.Lock()
+    db_path.parent.mkdir(parents = True, exist_ok = True)
+    # other processes hold the write lock for short transactions: wait for it
+    self._db = sqlite3.connect(str(db_path), timeout = 30.0, check_same_thread = False, isolation_level = None)
+    self._db.row_factory = sqlite3.Row
+    self._db.execute(f"PRAGMA journal_mode={journal}")
+    self._db.execute("PRAGMA synchronous=NORMAL")
+    self._tx(self._migrate)
+    self.created_at = float(self._db.execute("SELECT value FROM meta WHERE key = 'created_at'").fetchone()[0])
+    self.heartbeat()
+
+  def _migrate(self) -> None:
+    # executescript would commit the open transaction: one statement at a time
+    for stmt in _SCHEMA.split(";"):
+      if stmt.strip():
+        self._db.execute(stmt)
+    cols = {r["name"] for r in self._db.execute("PRAGMA table_info(sessions)")}
+    if "owner" not in cols:
+      # registries from before multi-process serving
+      self._db.execute("ALTER TABLE sessions ADD COLUMN owner TEXT")
+    self._db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('created_at', ?)", (repr(time.time()),))
+
+  def close(self) -> None:
+    with self._lock:
+      self._db.close()
+
+  def _tx(self, fn: Any, *args: Any) -> Any:
+    with self._lock:
+      self._db.execute("BEGIN IMMEDIATE")
+      try:
+        out = fn(*args)
+      except BaseException:
+        self._db.execute("ROLLBACK")
+        raise
+      self._db.execute("COMMIT")
+      return out
+
+  def _row(self, r: sqlite3.Row) -> dict[str, Any]:
+    return {
+      "created_at": r["created_at"],
+      "started_at": r["started_at"],
+      "finished_at": r["finished_at"],
+      "cfg": json.loads(r["cfg"]),
+      "status": r["status"],
+      "files": json.loads(r["files"]) if r["files"] is not None else None,
+      "error": r["error"],
+      "cache_key": r["cache_key"],
+    }
+
+  def _add_artefacts(self, sid: str, files: dict[str, Any] | None) -> None:
+    self._db.executemany(
+      "INSERT OR REPLACE INTO artefacts (sid, path, bytes) VALUES (?, ?, ?)",
+      [(sid, p, _file_size(p)) for p in _file_paths(files)],
+    )
+
+  # sessions
+
+  def create(
+    self,
+    sid: str,
+    cfg: dict[str, Any],
+    cache_key: str | None = None,
+    files: dict[str, Any] | None = None,
+  ) -> None:
+    """New session; with files it is a cache hit and starts out done."""
+    now = time.time()
+
+    def _do() -> None:
+      self._db.execute(
+        "INSERT INTO sessions (sid, created_at, finished_at, last_used, status, cfg, files, cache_key)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+          sid, now, now if files is not None else None, now,
+          "done" if files is not None else "created",
+          json.dumps(cfg), _jsonable(files), cache_key,
+        ),
+      )
+      self._add_artefacts(sid, files)
+
+    self._tx(_do)
+
+  def get(self, sid: str) -> dict[str, Any] | None:
+    with self._lock:
+      r = self._db.execute("SELECT * FROM sessions WHERE sid = ?", (sid,)).fetchone()
+    return self._row(r) if r is not None else None
+
+  def mark_queued(self, sid: str) -> bool:
+    """created -> queued; False when the session was already started (or is unknown)."""
+    now = time.time()
+    with self._lock:
+      cur = self._db.execute(
+        "UPDATE sessions SET status = 'queued', started_at = ?, last_used = ?, owner = ?"
+        " WHERE sid = ? AND status = 'created'",
+        (now, now, self.owner, sid),
+      )
+      return cur.rowcount == 1
+
+  def finish(self, sid: str, files: dict[str, Any], status: str = "done") -> None:
+    """Job ended with artefacts; status other than done marks a partial run (never a cache hit)."""
+    now = time.time()
+
+    def _do() -> None:
+      self._db.execute(
+        "UPDATE sessions SET status = ?, files = ?, finished_at = ?, last_used = ? WHERE sid = ?",
+        (status, _jsonable(files), now, now, sid),
+      )
+      self._add_artefacts(sid, files)
+
+    self._tx(_do)
+
+  def fail(self, sid: str, error: str) -> None:
+    now = time.time()
+    with self._lock:
+      self._db.execute(
+        "UPDATE sessions SET status = 'failed', error = ?, finished_at = ?, last_used = ? WHERE sid = ?",
+        (error, now, now, sid),
+      )
+
+  def cancel(self, sid: str) -> bool:
+    """created / queued / running -> cancelled without artefacts; False when already finished."""
+    now = time.time()
+    with self._lock:
+      cur = self._db.execute(
+        "UPDATE sessions SET status = 'cancelled', finished_at = ?, last_used = ?"
+        " WHERE sid = ? AND status IN ('created', ?, ?)",
+        (now, now, sid, *_ACTIVE),
+      )
+      return cur.rowcount == 1
+
+  def list_active(self) -> list[dict[str, Any]]:
+    """Queued and running sessions, oldest first."""
+    with self._lock:
+      rows = self._db.execute(
+        "SELECT sid, status, started_at, cfg, owner FROM sessions WHERE status IN (?, ?) ORDER BY started_at",
+        _ACTIVE,
+      ).fetchall()
+    return [
+      {
+        "sid": r["sid"], "status": r["status"], "started_at": r["started_at"],
+        "cfg": json.loads(r["cfg"]), "owner": r["owner"],
+      }
+      for r in rows
+    ]
+
+  def update_files(self, sid: str, files: dict[str, Any]) -> None:
+    """Artefacts added to a finished session (e.g. a store built on demand)."""
+
+    def _do() -> None:
+      self._db.execute("UPDATE sessions SET files = ? WHERE sid = ?", (_jsonable(files), sid))
+      self._add_artefacts(sid, files)
+
+    self._tx(_do)
+
+  def find_cached(self, cache_key: str) -> dict[str, Any] | None:
+    """Files of the latest finished run with this key whose artefacts all still exist."""
+    with self._lock:
+      r = self._db.execute(
+        "SELECT sid, files FROM sessions WHERE cache_key = ? AND status = 'done'"
+        " ORDER BY finished_at DESC LIMIT 1",
+        (cache_key,),
+      ).fetchone()
+      if r is None:
+        return None
+      files = json.loads(r["files"])
+      if not all(Path(p).exists() for p in _file_paths(files)):
+        # files removed behind our back: stop offering them
+        self._db.execute("UPDATE sessions SET cache_key = NULL WHERE cache_key = ?", (cache_key,))
+        return None
+      self._db.execute("UPDATE sessions SET last_used = ? WHERE sid = ?", (time.time(), r["sid"]))
+      return files
+
+  # owners
+
+  def heartbeat(self) -> None:
+    now = time.time()
+    with self._lock:
+      self._db.execute(
+        "INSERT INTO owners (owner, host, pid, started_at, heartbeat) VALUES (?, ?, ?, ?, ?)"
+        " ON CONFLICT(owner) DO UPDATE SET heartbeat = excluded.heartbeat",
+        (self.owner, self.host, os.getpid(), now, now),
+      )
+
+  def _reap(self, now: float) -> int:
+    dead = []
+    for r in self._db.execute("SELECT owner, host, pid, heartbeat FROM owners WHERE owner != ?", (self.owner,)):
+      if r["heartbeat"] < now - 3 * self.heartbeat_sec or (r["host"] == self.host and not _pid_alive(r["pid"])):
+        dead.append(r["owner"])
+    for owner in dead:
+      self._db.execute("DELETE FROM owners WHERE owner = ?", (owner,))
+    # jobs of dead owners, and of servers from before owners were recorded
+    cur = self._db.execute(
+      "UPDATE sessions SET status = 'failed', error = 'interrupted: server process gone', finished_at = ?"
+      " WHERE status IN (?, ?) AND (owner IS NULL OR owner NOT IN (SELECT owner FROM owners))",
+      (now, *_ACTIVE),
+    )
+    return cur.rowcount
+
+  def reap(self) -> int:
+    """Fails the queued/running sessions whose server process is gone, returns how many."""
+    return self._tx(self._reap, time.time())
+
+  def release_owner(self) -> None:
+    """On clean shutdown: this process's jobs are gone, others need not wait for the timeout."""
+    with self._lock:
+      self._db.execute("DELETE FROM owners WHERE owner = ?", (self.owner,))
+
+  # batches
+
+  def add_batch(self, bid: str, sids: list[str], score: dict[str, Any] | None) -> None:
+    with self._lock:
+      self._db.execute(
+        "INSERT INTO batches (bid, created_at, sids, score) VALUES (?, ?, ?, ?)",
+        (bid, time.time(), json.dumps(sids), json.dumps(score) if score is not None else None),
+      )
+
+  def get_batch(self, bid: str) -> dict[str, Any] | None:
+    with self._lock:
+      r = self._db.execute("SELECT * FROM batches WHERE bid = ?", (bid,)).fetchone()
+    if r is None:
+      return None
+    return {
+      "created_at": r["created_at"],
+      "sids": json.loads(r["sids"]),
+      "score": json.loads(r["score"]) if r["score"] is not None else None,
+    }
+
+  # eviction
+
+  def _drop(self, sids: list[str]) -> list[str]:
+    # removes the rows, returns the paths nothing references any more
+    paths: set[str] = set()
+    for i in range(0, len(sids), 500):
+      chunk = sids[i:i + 500]
+      marks = ",".join("?" * len(chunk))
+      paths.update(
+        r["path"] for r in self._db.execute(f"SELECT path FROM artefacts WHERE sid IN ({marks})", chunk)
+      )
+      self._db.execute(f"DELETE FROM artefacts WHERE sid IN ({marks})", chunk)
+      self._db.execute(f"DELETE FROM sessions WHERE sid IN ({marks})", chunk)
+    orphans = [
+      p for p in paths
+      if self._db.execute("SELECT 1 FROM artefacts WHERE path = ? LIMIT 1", (p,)).fetchone() is None
+    ]
+    self.evictions += len(sids)
+    return orphans
+
+  def _total_bytes(self) -> int:
+    r = self._db.execute("SELECT COALESCE(SUM(b), 0) FROM (SELECT MAX(bytes) AS b FROM artefacts GROUP BY path)")
+    return int(r.fetchone()[0])
+
+  def _evict(self, now: float) -> tuple[list[str], list[str]]:
+    idle = f"status NOT IN ('{_ACTIVE[0]}', '{_ACTIVE[1]}')"
+    sids = [
+      r["sid"] for r in self._db.execute(
+        f"SELECT sid FROM sessions WHERE {idle} AND last_used < ?", (now - self.ttl_sec,)
+      )
+    ]
+    orphans = self._drop(sids)
+
+    n = self._db.execute(f"SELECT COUNT(*) FROM sessions WHERE {idle}").fetchone()[0]
+    if n > self.max_sessions:
+      extra = [
+        r["sid"] for r in self._db.execute(
+          f"SELECT sid FROM sessions WHERE {idle} ORDER BY last_used LIMIT ?", (n - self.max_sessions,)
+        )
+      ]
+      sids += extra
+      orphans += self._drop(extra)
+
+    total = self._total_bytes()
+    while total > self.max_bytes:
+      # oldest first until enough bytes are freed (shared files may free less: loop),
+      # the latest session is kept even when it alone is over the limit
+      excess = total - self.max_bytes
+      victims: list[str] = []
+      for r in self._db.execute(
+        f"SELECT s.sid, SUM(a.bytes) AS b FROM sessions s JOIN artefacts a ON a.sid = s.sid"
+        f" WHERE s.{idle} AND s.sid != (SELECT sid FROM sessions ORDER BY last_used DESC LIMIT 1)"
+        f" GROUP BY s.sid ORDER BY s.last_used"
+      ):
+        victims.append(r["sid"])
+        excess -= r["b"]
+        if excess <= 0:
+          break
+      if not victims:
+        break
+      sids += victims
+      orphans += self._drop(victims)
+      total = self._total_bytes()
+
+    self._db.execute("DELETE FROM batches WHERE created_at < ?", (now - self.ttl_sec,))
+    return sids, orphans
+
+  def evict(self) -> int:
+    """Drops expired / surplus sessions and deletes their files, returns how many."""
+    now = time.time()
+    self._next_evict = now + self.evict_every_sec
+    sids, orphans = self._tx(self._evict, now)
+    # files go after the commit: a crash in between leaves orphans, not dangling rows
+    self._remove(orphans)
+    self._remove(str(progress_path(self.log_dir, sid)) for sid in sids)
+    return len(sids)
+
+  def maybe_evict(self) -> None:
+    if time.time() >= self._next_evict:
+      self.evict()
+
+  def _remove(self, paths: Iterable[str]) -> None:
+    for p in paths:
+      try:
+        os.remove(p)
+      except OSError:
+        pass
+
+  def sweep_orphans(self) -> int:
+    """
+    Deletes session files in log_dir no session knows about, older than the TTL.
+    Only files written since the registry exists: older logs are not ours to drop.
+    """
+    cutoff = time.time() - self.ttl_sec
+    removed = 0
+    try:
+      entries = list(os.scandir(self.log_dir))
+    except OSError:
+      return 0
+    for e in entries:
+      m = _ARTEFACT_RE.match(e.name)
+      if m is None or not e.is_file():
+        continue
+      try:
+        mtime = e.stat().st_mtime
+        if mtime >= cutoff or mtime < self.created_at:
+          continue
+      except OSError:
+        continue
+      with self._lock:
+        known = self._db.execute(
+          "SELECT 1 FROM artefacts WHERE path = ? UNION ALL SELECT 1 FROM sessions WHERE sid = ? LIMIT 1",
+          (str(Path(e.path)), m.group(1)),
+        ).fetchone()
+      if known is None:
+        self._remove([e.path])
+        removed += 1
+    return removed
+
+  def stats(self) -> dict[str, Any]:
+    with self._lock:
+      counts = {r[0]: r[1] for r in self._db.execute("SELECT status, COUNT(*) FROM sessions GROUP BY status")}
+      cached = self._db.execute(
+        "SELECT COUNT(DISTINCT cache_key) FROM sessions WHERE cache_key IS NOT NULL AND status = 'done'"
+      ).fetchone()[0]
+      total = self._total_bytes()
+    return {
+      "sessions": counts,
+      "cached_configs": cached,
+      "bytes": total,
+      "max_bytes": self.max_bytes,
+      "max_sessions": self.max_sessions,
+      "ttl_sec": self.ttl_sec,
+      "evictions": self.evictions,
+    }
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import math
+import threading
+from typing import Callable, Iterable, TypeVar
+
+
+# Prometheus text exposition (format 0.0.4) of in-process counters, histograms
+# and callback gauges; no client library needed.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = tuple[str, ...]
+M = TypeVar("M", bound = "_Metric")
+
+
+def _escape(v: str) -> str:
+  return v.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _fmt_labels(names: Iterable[str], values: Iterable[str]) -> str:
+  pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+  return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _fmt_value(v: float) -> str:
+  if math.isinf(v):
+    return "+Inf" if v > 0 else "-Inf"
+  if float(v).is_integer() and abs(v) < 1e15:
+    return str(int(v))
+  return repr(float(v))
+
+
+class _Metric:
+  kind = ""
+
+  def __init__(self, name: str, help: str, labelnames: Labels = ()) -> None:
+    self.name = name
+    self.help = help
+    self.labelnames = labelnames
+    self._lock = threading.Lock()
+
+  def header(self) -> list[str]:
+    return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+  def samples(self) -> list[str]:
+    raise NotImplementedError
+
+
+class Counter(_Metric):
+  kind = "counter"
+
+  def __init__(self, name: str, help: str, labelnames: Labels = ()) -> None:
+    super().__init__(name, help, labelnames)
+    self._values: dict[Labels, float] = {}
+
+  def inc(self, labels: Labels = (), v: float = 1.0) -> None:
+    with self._lock:
+      self._values[labels] = self._values.get(labels, 0.0) + v
+
+  def samples(self) -> list[str]:
+    with self._lock:
+      items = sorted(self._values.items())
+    return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+  kind = "histogram"
+
+  def __init__(self, name: str, help: str, buckets: list[float], labelnames: Labels = ()) -> None:
+    super().__init__(name, help, labelnames)
+    self.buckets = sorted(buckets) + [math.inf]
+    # labels -> (per-bucket counts, sum)
+    self._values: dict[Labels, tuple[list[int], list[float]]] = {}
+
+  def observe(self, value: float, labels: Labels = ()) -> None:
+    with self._lock:
+      counts, total = self._values.setdefault(labels, ([0] * len(self.buckets), [0.0]))
+      for i, b in enumerate(self.buckets):
+        if value <= b:
+          counts[i] += 1
+          break
+      total[0] += value
+
+  def samples(self) -> list[str]:
+    with self._lock:
+      items = sorted((k, (list(c), s[0])) for k, (c, s) in self._values.items())
+    out: list[str] = []
+    names = self.labelnames + ("le",)
+    for labels, (counts, total) in items:
+      acc = 0
+      for b, n in zip(self.buckets, counts):
+        acc += n
+        out.append(f"{self.name}_bucket{_fmt_labels(names, labels + (_fmt_value(b),))} {acc}")
+      out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, labels)} {_fmt_value(total)}")
+      out.append(f"{self.name}_count{_fmt_labels(self.labelnames, labels)} {acc}")
+    return out
+
+
+class GaugeFunc(_Metric):
+  """Gauge read at scrape time: fn() -> [(label values, value)]."""
+  kind = "gauge"
+
+  def __init__(self, name: str, help: str, fn: Callable[[], list[tuple[Labels, float]]], labelnames: Labels = ()) -> None:
+    super().__init__(name, help, labelnames)
+    self.fn = fn
+
+  def samples(self) -> list[str]:
+    return [f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in self.fn()]
+
+
+class CounterFunc(GaugeFunc):
+  """Counter kept elsewhere (e.g. cache hits), read at scrape time."""
+  kind = "counter"
+
+
+class Registry:
+
+  def __init__(self) -> None:
+    self._metrics: list[_Metric] = []
+
+  def register(self, m: M) -> M:
+    self._metrics.append(m)
+    return m
+
+  def counter(self, name: str, help: str, labelnames: Labels = ()) -> Counter:
+    return self.register(Counter(name, help, labelnames))
+
+  def histogram(self, name: str, help: str, buckets: list[float], labelnames: Labels = ()) -> Histogram:
+    return self.register(Histogram(name, help, buckets, labelnames))
+
+  def gauge(self, name: str, help: str, fn: Callable[[], list[tuple[Labels, float]]], labelnames: Labels = ()) -> GaugeFunc:
+    return self.register(GaugeFunc(name, help, fn, labelnames))
+
+  def counter_func(self, name: str, help: str, fn: Callable[[], list[tuple[Labels, float]]], labelnames: Labels = ()) -> CounterFunc:
+    return self.register(CounterFunc(name, help, fn, labelnames))
+
+  def render(self) -> str:
+    lines: list[str] = []
+    for m in self._metrics:
+      lines += m.header()
+      lines += m.samples()
+    return "\n".join(lines) + "\n"
+
+
+def size_class(agents: int, days: int) -> str:
+  """agents x days rounded up to a power of ten, the label of per-size histograms."""
+  n = max(1, agents * days)
+  return f"1e{max(3, min(9, math.ceil(math.log10(n))))}"
@@ -54,17 +54,38 @@ def _start_or_run(api: str, sid: str, timeout: float) -> Dict[str, Any]:
   last_err = None
   for path in (f"/session/{sid}/start", f"/session/{sid}/run"):
     try:
-      r = requests.post(f"{api}{path}", timeout = timeout)
+      r = requests.post(f"{api}{path}", timeout = 30.0)
+      t_end = time.time() + timeout
+      while r.status_code == 429 and time.time() < t_end:
+        # run queue full: wait as long as the server asks
+        time.sleep(float(r.headers.get("Retry-After", "1")))
+        r = requests.post(f"{api}{path}", timeout = 30.0)
       r.raise_for_status()
       data = r.json()
       if not isinstance(data, dict):
         raise RuntimeError(f"unexpected json at {path}: {data}")
-      return data
+      return _wait_done(api, sid, data, timeout)
+    except TimeoutError:
+      raise
     except Exception as e:
       last_err = e
   raise RuntimeError(f"cannot start/run session, last error: {last_err}")
 
 
+def _wait_done(api: str, sid: str, data: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+  t_end = time.time() + timeout
+  while data.get("status") in ("created", "queued", "running"):
+    if time.time() > t_end:
+      raise TimeoutError(f"session {sid} not done after {timeout:.0f} s")
+    time.sleep(0.5)
+    r = requests.get(f"{api}/session/{sid}", timeout = 30.0)
+    r.raise_for_status()
+    data = r.json()
+  if data.get("status") == "failed":
+    raise RuntimeError(f"session {sid} failed: {data.get('error')}")
+  return data
+
+
 def main() -> None:
   p = argparse.ArgumentParser()
   p.add_argument("--api", default = "http://127.0.0.1:8000")
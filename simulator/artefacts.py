@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import gzip
+import lzma
+import os
+from pathlib import Path
+from typing import IO, Any
+
+
+COMPRESS_SUFFIX = {"gzip": ".gz", "xz": ".xz"}
+
+
+def artefact_path(path: Path, compress: str | None) -> Path:
+  """path as written with the given compression (metrics_x.csv -> metrics_x.csv.gz)."""
+  if not compress or compress == "none":
+    return path
+  if compress not in COMPRESS_SUFFIX:
+    raise ValueError(f"unknown compress: {compress}")
+  return path.with_name(path.name + COMPRESS_SUFFIX[compress])
+
+
+def strip_compress_suffix(name: str) -> str:
+  for suffix in COMPRESS_SUFFIX.values():
+    if name.endswith(suffix):
+      return name[:-len(suffix)]
+  return name
+
+
+def resolve_artefact(path: str | os.PathLike[str]) -> Path:
+  """Existing file for path: itself or its .gz / .xz variant."""
+  p = Path(path)
+  if p.exists():
+    return p
+  for suffix in COMPRESS_SUFFIX.values():
+    alt = p.with_name(p.name + suffix)
+    if alt.exists():
+      return alt
+  return p
+
+
+def open_artefact(path: str | os.PathLike[str], mode: str = "r", **kwargs: Any) -> IO[Any]:
+  """
+  open() that handles .gz / .xz by suffix.
+  When reading, a missing plain file falls back to its compressed variant.
+  """
+  p = resolve_artefact(path) if mode.startswith("r") else Path(path)
+  if p.suffix in (".gz", ".xz"):
+    if "b" not in mode and "t" not in mode:
+      mode += "t"
+    if p.suffix == ".gz":
+      if not mode.startswith("r"):
+        kwargs.setdefault("compresslevel", 6)
+      return gzip.open(p, mode, **kwargs)
+    return lzma.open(p, mode, **kwargs)
+  return open(p, mode.replace("t", ""), **kwargs)
@@ -1,11 +1,23 @@
 from __future__ import annotations
 
 import csv
+import os
 import random
+import sys
 import time
+from collections import deque
+from contextlib import ExitStack
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
+
+from simulator.artefacts import artefact_path, open_artefact
+from simulator.metrics_store import MAX_TOTAL_FACTS, MetricsStoreWriter
+
+try:
+  import resource
+except ImportError:  # not on Windows
+  resource = None  # type: ignore[assignment]
 
 
 @dataclass
@@ -51,19 +63,89 @@ def _norm3(a: int, b: int, c: int) -> tuple[int, int, int]:
   return (aa, bb, cc)
 
 
-def _pick_weighted(rng: random.Random, items: list[tuple[str, int]]) -> str:
-  total = 0
-  for _, w in items:
-    total += max(0, int(w))
-  if total <= 0:
-    return items[-1][0]
-  r = rng.random() * total
-  acc = 0
-  for val, w in items:
-    acc += max(0, int(w))
-    if r <= acc:
-      return val
-  return items[-1][0]
+# Compiled strategy: (left threshold, right threshold, direction total,
+# p_house_exch, p_pet_exch). Thresholds are cumulative direction weights so the
+# day loop picks a direction with a single rng.random() draw.
+CompiledStrategy = tuple[int, int, int, int, int]
+
+# Common random numbers (cfg "crn"): every agent gets _CRN_SLOTS uniforms a
+# day whether it uses them or not: house exchange, its partner, pet exchange,
+# its partner, staying after an exchange, direction, meet noise. An agent's
+# draws then depend on (seed, agent, day) only, so changing one agent's
+# strategy leaves the random numbers of all the others where they were.
+_CRN_SLOTS = 7
+
+_DEFAULT_STRATEGY: CompiledStrategy = (33, 66, 100, 10, 10)
+
+
+def _compile_strategy(strategy: Any) -> CompiledStrategy | None:
+  try:
+    s = dict(strategy)
+  except Exception:
+    return None
+  p_left, p_right, p_home = _norm3(
+    int(s.get("p_left", 33)),
+    int(s.get("p_right", 33)),
+    int(s.get("p_home", 34)),
+  )
+  return (
+    p_left,
+    p_left + p_right,
+    p_left + p_right + p_home,
+    _clamp_int(int(s.get("p_house_exch", 0)), 0, 100),
+    _clamp_int(int(s.get("p_pet_exch", 0)), 0, 100),
+  )
+
+
+def _compile_strategies(cfg: dict[str, Any], names: list[str], seed: int) -> list[CompiledStrategy]:
+  """
+  Builds the per-agent strategy table once per session.
+
+  Layers, later ones win:
+  - default strategy for everybody;
+  - "strategies": list of strategies assigned round-robin (agent i gets i % len);
+  - "strategy_mix": list of strategies with a "weight" key, each agent draws one
+    (own rng derived from seed, so the simulation stream is not shifted);
+  - "mt_who" + "mt_strategy" and "mt_overrides" ({name: strategy}): per-agent
+    overrides, e.g. several optimizer candidates scored in one simulation.
+  """
+  table = [_DEFAULT_STRATEGY] * len(names)
+
+  strategies = cfg.get("strategies", None)
+  strategy_mix = cfg.get("strategy_mix", None)
+  if strategies and strategy_mix:
+    raise ValueError("use either strategies or strategy_mix, not both")
+
+  if strategies:
+    compiled = [_compile_strategy(x) or _DEFAULT_STRATEGY for x in strategies]
+    for i in range(len(names)):
+      table[i] = compiled[i % len(compiled)]
+
+  if strategy_mix:
+    compiled = [_compile_strategy(x) or _DEFAULT_STRATEGY for x in strategy_mix]
+    weights = [max(0.0, float(dict(x).get("weight", 1.0))) for x in strategy_mix]
+    if sum(weights) <= 0.0:
+      raise ValueError("strategy_mix weights must not all be zero")
+    mix_rng = random.Random(f"{seed}:strategy_mix")
+    table = mix_rng.choices(compiled, weights = weights, k = len(names))
+
+  overrides: dict[str, Any] = {}
+  mt_who = cfg.get("mt_who", None)
+  mt_strategy = cfg.get("mt_strategy", None)
+  if mt_who is not None and mt_strategy is not None:
+    overrides[str(mt_who)] = mt_strategy
+  overrides.update(dict(cfg.get("mt_overrides", None) or {}))
+
+  if overrides:
+    index = {name: i for i, name in enumerate(names)}
+    for who, strategy in overrides.items():
+      i = index.get(who)
+      compiled = _compile_strategy(strategy)
+      if i is None or compiled is None:
+        continue
+      table[i] = compiled
+
+  return table
 
 
 def _wrap_house(x: int, houses: int) -> int:
@@ -74,6 +156,85 @@ def _wrap_house(x: int, houses: int) -> int:
   return x
 
 
+def _usage() -> tuple[float, float, int, int, int] | None:
+  # (user sec, sys sec, peak rss kB, blocks in, blocks out) of this process
+  if resource is None:
+    return None
+  ru = resource.getrusage(resource.RUSAGE_SELF)
+  return ru.ru_utime, ru.ru_stime, ru.ru_maxrss, ru.ru_inblock, ru.ru_oublock
+
+
+def _reset_peak_rss() -> bool:
+  # Linux: writing 5 to clear_refs resets VmHWM (the peak RSS) to the current RSS
+  try:
+    with open("/proc/self/clear_refs", "w") as f:
+      f.write("5")
+    return True
+  except OSError:
+    return False
+
+
+def _peak_rss_since_reset() -> int | None:
+  try:
+    with open("/proc/self/status") as f:
+      for line in f:
+        if line.startswith("VmHWM:"):
+          return int(line.split()[1])
+  except (OSError, ValueError):
+    pass
+  return None
+
+
+def _resources(
+  t0: float,
+  u0: tuple[float, float, int, int, int] | None,
+  events: int,
+  files: dict[str, Path],
+  peak_reset: bool = False,
+) -> dict[str, Any]:
+  """
+  What a run cost: wall and CPU seconds, peak RSS, block I/O, events and bytes per file.
+  Peak RSS is this run's when the peak could be reset at its start (peak_reset,
+  Linux). Otherwise it is only known when the run raised the process maximum;
+  a pool worker's earlier, larger run leaves it None.
+  """
+  res: dict[str, Any] = {
+    "wall_sec": time.perf_counter() - t0,
+    "cpu_sec": None,
+    "user_sec": None,
+    "sys_sec": None,
+    "peak_rss_kb": None,
+    "io_in_blocks": None,
+    "io_out_blocks": None,
+    "events": events,
+    "bytes": {k: os.path.getsize(p) for k, p in files.items()},
+  }
+  u1 = _usage()
+  if u0 is not None and u1 is not None:
+    res["user_sec"] = u1[0] - u0[0]
+    res["sys_sec"] = u1[1] - u0[1]
+    res["cpu_sec"] = res["user_sec"] + res["sys_sec"]
+    if u1[2] > u0[2]:
+      # ru_maxrss is in bytes on macOS, kB elsewhere
+      res["peak_rss_kb"] = u1[2] // 1024 if sys.platform == "darwin" else u1[2]
+    res["io_in_blocks"] = u1[3] - u0[3]
+    res["io_out_blocks"] = u1[4] - u0[4]
+  if peak_reset:
+    res["peak_rss_kb"] = _peak_rss_since_reset()
+  return res
+
+
+def score_values(vals: list[float], mode: str, tail: int) -> float:
+  if not vals:
+    return 0.0
+  if mode == "final":
+    return float(vals[-1])
+  if mode == "mean_tail":
+    k = min(tail, len(vals))
+    return float(sum(vals[-k:]) / k)
+  raise ValueError(mode)
+
+
 def _write_xml(xml_path: Path, session_id: str, events: list[dict[str, Any]]) -> None:
   parts: list[str] = []
   parts.append(f'<game session = "{session_id}">')
@@ -81,10 +242,29 @@ def _write_xml(xml_path: Path, session_id: str, events: list[dict[str, Any]]) ->
     attrs = " ".join(f'{k} = "{str(v)}"' for k, v in e.items())
     parts.append(f"  <event {attrs} />")
   parts.append("</game>\n")
-  xml_path.write_text("\n".join(parts), encoding = "utf-8")
-
-
-def run_session(session_id: str, cfg: dict[str, Any], log_dir: Path) -> dict[str, Any]:
+  with open_artefact(xml_path, "w", encoding = "utf-8") as f:
+    f.write("\n".join(parts))
+
+
+def run_session(
+  session_id: str,
+  cfg: dict[str, Any],
+  log_dir: Path,
+  progress: Callable[[dict[str, Any]], None] | None = None,
+  progress_sec: float = 0.5,
+  stop: Callable[[], str | None] | None = None,
+) -> dict[str, Any]:
+  """
+  progress, when given, is called with {"day", "days", "mean_sa", "events"}
+  at most every progress_sec seconds and always for the last day.
+
+  stop, when given, is called after every day; a non-empty reason ends the run
+  there: the artefacts cover the days simulated so far (the metrics get a row
+  for the last of them) and the result carries "interrupted": reason.
+  """
+  t0 = time.perf_counter()
+  u0 = _usage()
+  peak_reset = _reset_peak_rss()
   log_dir.mkdir(parents=True, exist_ok=True)
 
   agents_n = int(cfg.get("agents", 6))
@@ -94,9 +274,22 @@ def run_session(session_id: str, cfg: dict[str, Any], log_dir: Path) -> dict[str
   share = str(cfg.get("share", "none"))
   noise = float(cfg.get("noise", 0.0))
   seed = cfg.get("seed", None)
-
-  mt_who = cfg.get("mt_who", None)
-  mt_strategy = cfg.get("mt_strategy", None)
+  crn = bool(cfg.get("crn", False))
+  occupancy = bool(cfg.get("occupancy", False))
+  compress = cfg.get("compress", None)
+
+  # artefacts to write; the event list is not even kept without csv/xml
+  outputs = cfg.get("outputs", None)
+  outputs = {"csv", "xml", "metrics"} if outputs is None else set(outputs)
+  keep_rows = "csv" in outputs
+  keep_xml = "xml" in outputs
+
+  # time series rows: every K-th day and/or listed days, the last day always
+  metrics_days = {int(d) for d in (cfg.get("metrics_days", None) or [])}
+  metrics_every = cfg.get("metrics_every", None)
+  if metrics_every is None:
+    metrics_every = 0 if metrics_days else 1
+  metrics_every = max(0, int(metrics_every))
 
   if seed is None:
     seed = int(session_id[:8], 16) & 0x7FFFFFFF
@@ -118,22 +311,42 @@ def run_session(session_id: str, cfg: dict[str, Any], log_dir: Path) -> dict[str
       )
     )
 
-  def mt_for(a: Agent) -> dict[str, int] | None:
-    if mt_who is None or mt_strategy is None:
-      return None
-    if a.name != mt_who:
-      return None
-    try:
-      s = dict(mt_strategy)
-    except Exception:
-      return None
-    return {
-      "p_left": int(s.get("p_left", 33)),
-      "p_right": int(s.get("p_right", 33)),
-      "p_home": int(s.get("p_home", 34)),
-      "p_house_exch": int(s.get("p_house_exch", 0)),
-      "p_pet_exch": int(s.get("p_pet_exch", 0)),
-    }
+  strategy_table = _compile_strategies(cfg, [a.name for a in agents], seed)
+
+  # Occupancy is kept up to date on startTrip/FinishTrip instead of regrouping
+  # agents every day. members[h] holds indices of agents whose location is h
+  # (travellers stay at their origin until FinishTrip, as the meet step sees
+  # them); present[h] counts those of them who are not travelling.
+  members: list[dict[int, None]] = [{} for _ in range(houses + 1)]
+  present = [0] * (houses + 1)
+  for i, a in enumerate(agents):
+    members[a.location][i] = None
+    present[a.location] += 1
+
+  # score spec: per-agent M1 of the last `tail` metrics rows is kept in memory,
+  # so the score needs no metrics file; rows are the days the metrics file has
+  # (metrics_every / metrics_days, every day by default), values rounded like it,
+  # so it is the score server.scores computes from the file
+  score_spec = cfg.get("score", None)
+  score_who: list[str] = []
+  score_idx: list[int] = []
+  score_buf: list[deque[float]] = []
+  score_mode = "final"
+  score_tail = 1
+  if score_spec:
+    who = score_spec.get("who", [])
+    score_who = [who] if isinstance(who, str) else list(who)
+    score_mode = str(score_spec.get("mode", "final"))
+    score_tail = max(1, int(score_spec.get("tail", 20)))
+    if score_mode not in ("final", "mean_tail"):
+      raise ValueError(f"unknown score mode: {score_mode}")
+    index = {a.name: i for i, a in enumerate(agents)}
+    for name in score_who:
+      if name not in index:
+        raise ValueError(f"unknown score agent: {name}")
+      score_idx.append(index[name])
+    keep = 1 if score_mode == "final" else score_tail
+    score_buf = [deque(maxlen = keep) for _ in score_who]
 
   event_rows: list[list[str]] = []
   xml_events: list[dict[str, Any]] = []
@@ -142,72 +355,104 @@ def run_session(session_id: str, cfg: dict[str, Any], log_dir: Path) -> dict[str
   def log_event(day: int, kind: str, *cols: Any) -> None:
     nonlocal eid
     eid += 1
+    if not keep_rows and not keep_xml:
+      return
     row = [str(eid), str(day), kind]
     for x in cols:
       row.append("" if x is None else str(x))
     while len(row) < 10:
       row.append("")
-    event_rows.append(row[:10])
-
-    xml_events.append(
-      {"id": eid, "day": day, "type": kind, "a": row[3] if len(row) > 3 else ""}
-    )
-
-  metrics_path = log_dir / f"metrics_{session_id}.csv"
-  events_path = log_dir / f"game_{session_id}.csv"
-  xml_path = log_dir / f"game_{session_id}.xml"
+    if keep_rows:
+      event_rows.append(row[:10])
 
-  with metrics_path.open("w", newline = "", encoding = "utf-8") as mf:
-    w = csv.writer(mf)
-    header = ["day"] + [a.name for a in agents]
-    w.writerow(header)
+    if keep_xml:
+      xml_events.append(
+        {"id": eid, "day": day, "type": kind, "a": row[3] if len(row) > 3 else ""}
+      )
 
+  next_progress = time.monotonic() + progress_sec
+  interrupted: str | None = None
+  days_done = 0
+
+  metrics_path = artefact_path(log_dir / f"metrics_{session_id}.csv", compress)
+  events_path = artefact_path(log_dir / f"game_{session_id}.csv", compress)
+  xml_path = artefact_path(log_dir / f"game_{session_id}.xml", compress)
+  occupancy_path = artefact_path(log_dir / f"occupancy_{session_id}.csv", compress)
+  # seekable copy of the metrics for slice queries, never compressed: only on
+  # request ("metrics_store" output), the server builds it on first use otherwise
+  metrics_bin_path = log_dir / f"metrics_{session_id}.bin"
+  keep_bin = "metrics_store" in outputs and total_facts <= MAX_TOTAL_FACTS
+
+  with ExitStack() as stack:
+    w = None
+    if "metrics" in outputs:
+      mf = stack.enter_context(open_artefact(metrics_path, "w", newline = "", encoding = "utf-8"))
+      w = csv.writer(mf)
+      header = ["day"] + [a.name for a in agents]
+      w.writerow(header)
+
+    bw = None
+    if keep_bin:
+      bw = MetricsStoreWriter(stack.enter_context(metrics_bin_path.open("wb")), agents_n, total_facts)
+
+    ow = None
+    if occupancy:
+      of = stack.enter_context(open_artefact(occupancy_path, "w", newline = "", encoding = "utf-8"))
+      ow = csv.writer(of)
+      ow.writerow(["day"] + [f"h{h}" for h in range(1, houses + 1)] + ["travelling"])
+
+    draws: list[float] = []
     for day in range(1, days + 1):
-      for a in agents:
+      if crn:
+        draws = [rng.random() for _ in range(_CRN_SLOTS * agents_n)]
+      for i, a in enumerate(agents):
         if a.trip.active:
           a.trip.remaining -= 1
           if a.trip.remaining <= 0:
+            del members[a.location][i]
             a.location = a.trip.dst
             a.trip.active = False
+            members[a.location][i] = None
+            present[a.location] += 1
             log_event(day, "FinishTrip", a.name, a.location)
             a.known = min(total_facts, a.known + 1)
           continue
 
-        strat = mt_for(a)
-        if strat is None:
-          p_left, p_right, p_home = (33, 33, 34)
-          p_house_exch = 10
-          p_pet_exch = 10
-        else:
-          p_left, p_right, p_home = _norm3(strat["p_left"], strat["p_right"], strat["p_home"])
-          p_house_exch = _clamp_int(strat["p_house_exch"], 0, 100)
-          p_pet_exch = _clamp_int(strat["p_pet_exch"], 0, 100)
+        c_left, c_right, c_total, p_house_exch, p_pet_exch = strategy_table[i]
 
         did_exch = False
+        k = _CRN_SLOTS * i
 
-        if rng.randint(1, 100) <= p_house_exch:
-          partner = rng.randrange(agents_n)
+        # crn: u * 100 < p is randint(1, 100) <= p, int(u * n) is randrange(n)
+        if (draws[k] * 100 < p_house_exch) if crn else (rng.randint(1, 100) <= p_house_exch):
+          partner = int(draws[k + 1] * agents_n) if crn else rng.randrange(agents_n)
           b = agents[partner]
           a.house_id, b.house_id = b.house_id, a.house_id
           log_event(day, "changeHouse", a.name, b.name, a.location)
           a.known = min(total_facts, a.known + 2)
           did_exch = True
 
-        if rng.randint(1, 100) <= p_pet_exch:
-          partner = rng.randrange(agents_n)
+        if (draws[k + 2] * 100 < p_pet_exch) if crn else (rng.randint(1, 100) <= p_pet_exch):
+          partner = int(draws[k + 3] * agents_n) if crn else rng.randrange(agents_n)
           b = agents[partner]
           a.pet_id, b.pet_id = b.pet_id, a.pet_id
           log_event(day, "changePet", a.name, b.name, a.location)
           a.known = min(total_facts, a.known + 2)
           did_exch = True
 
-        if did_exch and rng.random() < 0.4:
+        if did_exch and (draws[k + 4] if crn else rng.random()) < 0.4:
           pass
         else:
-          direction = _pick_weighted(
-            rng,
-            [("left", p_left), ("right", p_right), ("home", p_home)],
-          )
+          if c_total <= 0:
+            direction = "home"
+          else:
+            r = (draws[k + 5] if crn else rng.random()) * c_total
+            if r <= c_left:
+              direction = "left"
+            elif r <= c_right:
+              direction = "right"
+            else:
+              direction = "home"
 
           src = a.location
           if direction == "home":
@@ -221,43 +466,89 @@ def run_session(session_id: str, cfg: dict[str, Any], log_dir: Path) -> dict[str
             a.trip.active = True
             a.trip.dst = dst
             a.trip.remaining = 1
+            present[src] -= 1
             log_event(day, "startTrip", a.name, src, dst, 1)
             a.known = min(total_facts, a.known + 1)
 
       if share == "meet":
-        groups: dict[int, list[Agent]] = {}
-        for a in agents:
-          groups.setdefault(a.location, []).append(a)
+        groups = [m for m in members if len(m) >= 2]
+        if noise > 0.0:
+          # noise consumes rng per agent, keep the agent-index order
+          groups = sorted((sorted(m) for m in groups), key = lambda g: g[0])
 
-        for loc, group in groups.items():
-          if len(group) < 2:
-            continue
-          best = max(x.known for x in group)
-          for x in group:
-            x.known = best
+        for group in groups:
+          best = max(agents[j].known for j in group)
+          for j in group:
+            agents[j].known = best
 
           if noise > 0.0:
-            for x in group:
-              if rng.random() < noise:
+            for j in group:
+              x = agents[j]
+              if (draws[_CRN_SLOTS * j + 6] if crn else rng.random()) < noise:
                 if x.known > 0:
                   x.known -= 1
 
-      row = [day]
-      for a in agents:
-        m1 = a.known / float(total_facts)
-        row.append(f"{m1:.6f}")
-      w.writerow(row)
-
-  with events_path.open("w", newline = "", encoding = "utf-8") as ef:
-    ef.write("eventID;day;event;a;b;c;d;e;f;g\n")
-    for r in event_rows:
-      ef.write(";".join(r) + "\n")
-
-  _write_xml(xml_path, session_id = session_id, events = xml_events)
-
-  return {
-    "csv": events_path,
-    "xml": xml_path,
-    "metrics": metrics_path,
+      days_done = day
+      if stop is not None:
+        interrupted = stop() or None
+
+      if day == days or interrupted or day in metrics_days or (metrics_every and day % metrics_every == 0):
+        for buf, i in zip(score_buf, score_idx):
+          buf.append(round(agents[i].known / float(total_facts), 6))
+
+        if w is not None:
+          row = [day]
+          for a in agents:
+            m1 = a.known / float(total_facts)
+            row.append(f"{m1:.6f}")
+          w.writerow(row)
+
+        if bw is not None:
+          bw.write_row(day, [a.known for a in agents])
+
+        if ow is not None:
+          ow.writerow([day] + present[1:] + [agents_n - sum(present)])
+
+      if progress is not None and (day == days or interrupted or time.monotonic() >= next_progress):
+        progress({
+          "day": day,
+          "days": days,
+          "mean_sa": sum(a.known for a in agents) / float(total_facts * agents_n),
+          "events": eid,
+        })
+        next_progress = time.monotonic() + progress_sec
+
+      if interrupted:
+        break
+
+  if keep_rows:
+    with open_artefact(events_path, "w", newline = "", encoding = "utf-8") as ef:
+      ef.write("eventID;day;event;a;b;c;d;e;f;g\n")
+      for r in event_rows:
+        ef.write(";".join(r) + "\n")
+
+  if keep_xml:
+    _write_xml(xml_path, session_id = session_id, events = xml_events)
+
+  out: dict[str, Any] = {
+    "csv": events_path if keep_rows else None,
+    "xml": xml_path if keep_xml else None,
+    "metrics": metrics_path if "metrics" in outputs else None,
+    "metrics_bin": metrics_bin_path if keep_bin else None,
+    "occupancy": occupancy_path if occupancy else None,
     "finished_at": time.time(),
+    "days_done": days_done,
   }
+  if interrupted:
+    out["interrupted"] = interrupted
+  out["resources"] = _resources(
+    t0, u0, eid,
+    {k: v for k, v in out.items() if isinstance(v, Path)},
+    peak_reset,
+  )
+  if score_spec:
+    out["scores"] = {
+      who: score_values(list(buf), score_mode, score_tail)
+      for who, buf in zip(score_who, score_buf)
+    }
+  return out
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import csv
+import os
+import struct
+import sys
+import uuid
+from array import array
+from pathlib import Path
+from typing import IO
+
+from simulator.artefacts import open_artefact
+
+
+# Seekable sidecar of the metrics csv, fixed-width little-endian rows:
+#
+#   header: b"ZM1\n", uint32 agents, uint32 total_facts
+#   row:    uint32 day, uint16 known[agents]
+#
+# so a (days x agents) slice is a binary search over the day column plus one
+# pread per selected row and column run, whatever the session size.
+# M1 of agent i on a row is known[i] / total_facts.
+
+MAGIC = b"ZM1\n"
+# known counts are uint16
+MAX_TOTAL_FACTS = 0xFFFF
+_HEADER = struct.Struct("<4sII")
+_DAY = struct.Struct("<I")
+# columns closer than this (in values) are read with one pread
+_MERGE_GAP = 32
+
+
+def _le(values: array) -> bytes:
+  if sys.byteorder == "big":
+    values = array(values.typecode, values)
+    values.byteswap()
+  return values.tobytes()
+
+
+class MetricsStoreWriter:
+
+  def __init__(self, f: IO[bytes], agents: int, total_facts: int) -> None:
+    self.f = f
+    self.agents = agents
+    self.f.write(_HEADER.pack(MAGIC, agents, total_facts))
+
+  def write_row(self, day: int, known: list[int]) -> None:
+    self.f.write(_DAY.pack(day) + _le(array("H", known)))
+
+
+def build_from_csv(metrics_path: str | os.PathLike[str], store_path: Path, total_facts: int) -> None:
+  """Store for a metrics csv written before the engine produced one."""
+  # a tmp name of our own: concurrent builders never share or replace it
+  tmp = store_path.with_name(f"{store_path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")
+  try:
+    with open_artefact(metrics_path, "r", encoding = "utf-8", newline = "") as src, tmp.open("wb") as dst:
+      r = csv.reader(src)
+      header = next(r, None)
+      if not header or header[0] != "day":
+        raise ValueError(f"bad metrics header: {header[:10] if header else header}")
+      w = MetricsStoreWriter(dst, len(header) - 1, total_facts)
+      for row in r:
+        w.write_row(int(row[0]), [round(float(x) * total_facts) for x in row[1:]])
+    try:
+      os.replace(tmp, store_path)
+    except OSError:
+      # another builder got there first
+      if not store_path.is_file():
+        raise
+  finally:
+    tmp.unlink(missing_ok = True)
+
+
+def _runs(cols: list[int]) -> list[tuple[int, int, list[int]]]:
+  # (first col, count, positions of the wanted cols inside the run)
+  runs: list[tuple[int, int, list[int]]] = []
+  for c in sorted(set(cols)):
+    if runs and c - (runs[-1][0] + runs[-1][1]) < _MERGE_GAP:
+      first, _, pos = runs[-1]
+      runs[-1] = (first, c - first + 1, pos + [c - first])
+    else:
+      runs.append((c, 1, [0]))
+  return runs
+
+
+class MetricsStore:
+
+  def __init__(self, path: Path) -> None:
+    self.path = path
+    self._fd = os.open(path, os.O_RDONLY)
+    try:
+      magic, self.agents, self.total_facts = _HEADER.unpack(os.pread(self._fd, _HEADER.size, 0))
+    except struct.error:
+      os.close(self._fd)
+      raise ValueError(f"truncated metrics store: {path}")
+    if magic != MAGIC:
+      os.close(self._fd)
+      raise ValueError(f"not a metrics store: {path}")
+    self.row_size = _DAY.size + 2 * self.agents
+    # a row still being written is not counted
+    self.rows = (os.fstat(self._fd).st_size - _HEADER.size) // self.row_size
+
+  def close(self) -> None:
+    os.close(self._fd)
+
+  def __enter__(self) -> MetricsStore:
+    return self
+
+  def __exit__(self, *exc: object) -> None:
+    self.close()
+
+  def _offset(self, row: int) -> int:
+    return _HEADER.size + row * self.row_size
+
+  def _day(self, row: int) -> int:
+    return _DAY.unpack(os.pread(self._fd, _DAY.size, self._offset(row)))[0]
+
+  def _first_row(self, day: int) -> int:
+    lo, hi = 0, self.rows
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if self._day(mid) < day:
+        lo = mid + 1
+      else:
+        hi = mid
+    return lo
+
+  def read_known(
+    self,
+    cols: list[int] | None,
+    day_from: int = 1,
+    day_to: int | None = None,
+    every: int = 1,
+  ) -> tuple[list[int], list[array]]:
+    """
+    Stored rows with day_from <= day <= day_to, every `every`-th of them,
+    projected on cols (all when None): (days, known counts per row, in cols order).
+    """
+    if cols is not None:
+      for c in cols:
+        if not 0 <= c < self.agents:
+          raise IndexError(c)
+    days: list[int] = []
+    rows: list[array] = []
+    every = max(1, every)
+    runs = None if cols is None else _runs(cols)
+    order = None if cols is None else {c: i for i, c in enumerate(sorted(set(cols)))}
+
+    row = self._first_row(day_from)
+    while row < self.rows:
+      off = self._offset(row)
+      if cols is None:
+        buf = os.pread(self._fd, self.row_size, off)
+        day = _DAY.unpack_from(buf)[0]
+      else:
+        day = self._day(row)
+      if day_to is not None and day > day_to:
+        break
+      if cols is None:
+        vals = array("H")
+        vals.frombytes(buf[_DAY.size:])
+        if sys.byteorder == "big":
+          vals.byteswap()
+      else:
+        picked = array("H")
+        for first, count, pos in runs:
+          run = array("H")
+          run.frombytes(os.pread(self._fd, 2 * count, off + _DAY.size + 2 * first))
+          if sys.byteorder == "big":
+            run.byteswap()
+          picked.extend(run[p] for p in pos)
+        vals = array("H", (picked[order[c]] for c in cols))
+      days.append(day)
+      rows.append(vals)
+      row += every
+    return days, rows
@@ -4,6 +4,7 @@ import asyncio
 import os
 import subprocess
 import sys
+import time
 import traceback
 import zipfile
 from dataclasses import dataclass
@@ -15,6 +16,9 @@ from aiogram import Bot, Dispatcher
 from aiogram.filters import Command
 from aiogram.types import FSInputFile, Message
 
+from analysis.process_log import events_summary_path
+from simulator.artefacts import open_artefact, strip_compress_suffix
+
 
 ROOT_DIR = Path(__file__).resolve().parent
 LOG_DIR = ROOT_DIR / "data" / "logs"
@@ -29,6 +33,7 @@ class RunCfg:
   noise: float = 0.2
   seed: int | None = None
   t: int = 500
+  compress: str | None = None
 
 
 def _parse_kv(tokens: list[str]) -> dict[str, str]:
@@ -63,6 +68,8 @@ def _parse_run_args(text: str) -> RunCfg:
     cfg.seed = int(kv["seed"])
   if "t" in kv:
     cfg.t = int(kv["t"])
+  if "compress" in kv:
+    cfg.compress = kv["compress"] if kv["compress"] != "none" else None
 
   pos = [t for t in tokens if "=" not in t]
   if pos:
@@ -106,6 +113,8 @@ def _create_session(api: str, cfg: RunCfg) -> str:
   }
   if cfg.seed is not None:
     payload["seed"] = cfg.seed
+  if cfg.compress is not None:
+    payload["compress"] = cfg.compress
 
   last_err: Exception | None = None
   for path in ("/session/create", "/session"):
@@ -121,11 +130,16 @@ def _create_session(api: str, cfg: RunCfg) -> str:
   raise RuntimeError(f"cannot create session, last error: {last_err}")
 
 
-def _start_session(api: str, sid: str, timeout: float) -> dict[str, Any]:
+def _start_session(api: str, sid: str) -> dict[str, Any]:
   last_err: Exception | None = None
   for path in (f"/session/{sid}/run", f"/session/{sid}/start"):
     try:
-      r = requests.post(f"{api}{path}", timeout=timeout)
+      r = requests.post(f"{api}{path}", timeout=30.0)
+      t_end = time.time() + 600.0
+      while r.status_code == 429 and time.time() < t_end:
+        # run queue full: wait as long as the server asks
+        time.sleep(float(r.headers.get("Retry-After", "1")))
+        r = requests.post(f"{api}{path}", timeout=30.0)
       r.raise_for_status()
       data = r.json()
       if not isinstance(data, dict):
@@ -136,18 +150,72 @@ def _start_session(api: str, sid: str, timeout: float) -> dict[str, Any]:
   raise RuntimeError(f"cannot start session, last error: {last_err}")
 
 
-def _ensure_file(path: str) -> Path:
+def _get_status(api: str, sid: str) -> dict[str, Any]:
+  r = requests.get(f"{api}/session/{sid}", timeout=30.0)
+  r.raise_for_status()
+  data = r.json()
+  if not isinstance(data, dict):
+    raise RuntimeError(f"bad json from /session/{sid}: {data}")
+  return data
+
+
+async def _wait_session(bot: Bot, chat_id: int, api: str, sid: str, data: dict[str, Any], timeout: float) -> dict[str, Any]:
+  # /run only queues the session: poll its status and keep one progress message up to date
+  t_end = time.time() + timeout
+  note: Message | None = None
+  last_text = ""
+  while data.get("status") in ("created", "queued", "running"):
+    if time.time() > t_end:
+      raise TimeoutError(f"session {sid} not done after {timeout:.0f} s")
+    await asyncio.sleep(5.0)
+    data = await asyncio.to_thread(_get_status, api, sid)
+    p = data.get("progress")
+    if not isinstance(p, dict):
+      continue
+    text = f"session={sid}: день {p.get('day')}/{p.get('days')}, SA={float(p.get('mean_sa', 0.0)):.3f}, событий {p.get('events')}"
+    if text == last_text:
+      continue
+    if note is None:
+      note = await bot.send_message(chat_id, text)
+    else:
+      await note.edit_text(text)
+    last_text = text
+
+  # cancelled / timeout runs stop midway: their artefacts are not a result
+  status = data.get("status")
+  if status in ("failed", "cancelled", "timeout"):
+    raise RuntimeError(f"session {sid} {status}: {data.get('error')}")
+  return data
+
+
+_ARTEFACT_URLS = {"csv": "log/csv", "xml": "log/xml", "metrics": "metrics"}
+
+
+def _fetch_artefact(api: str, sid: str, kind: str, dest: Path) -> Path:
+  # server on another host: download through the artefact endpoint (gzip on the wire)
+  dest.parent.mkdir(parents=True, exist_ok=True)
+  tmp = dest.with_name(dest.name + ".part")
+  with requests.get(f"{api}/session/{sid}/{_ARTEFACT_URLS[kind]}", stream=True, timeout=60.0) as r:
+    r.raise_for_status()
+    with tmp.open("wb") as f:
+      for chunk in r.iter_content(chunk_size=64 * 1024):
+        f.write(chunk)
+  tmp.replace(dest)
+  return dest
+
+
+def _ensure_file(api: str, sid: str, kind: str, path: str) -> Path:
   p = Path(path)
   if not p.is_absolute():
     p = (ROOT_DIR / p).resolve()
-  if not p.exists():
-    raise FileNotFoundError(str(p))
-  return p
+  if p.exists():
+    return p
+  return _fetch_artefact(api, sid, kind, LOG_DIR / f"bot_{sid}" / "remote" / strip_compress_suffix(p.name))
 
 
 def _count_lines(path: Path, limit: int = 2_000_000) -> int:
   n = 0
-  with path.open("rb") as f:
+  with open_artefact(path, "rb") as f:
     for _ in f:
       n += 1
       if n >= limit:
@@ -185,9 +253,8 @@ def _run_process_log(metrics: Path, events: Path, out_dir: Path, t: int) -> None
     )
 
 
-def _zip_awareness(out_dir: Path, sid: str) -> Path:
+def _zip_awareness(out_dir: Path, sid: str, summary_path: Path) -> Path:
   zip_path = out_dir / f"awareness_{sid}.zip"
-  summary_path = out_dir / f"game_{sid}_summary.yaml"
 
   with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) as z:
     for p in sorted(out_dir.glob("awareness-*.csv")):
@@ -204,7 +271,8 @@ async def cmd_help(message: Message) -> None:
   txt = (
     "Команды:\n"
     "/run agents houses days share noise seed t\n"
-    "/run agents = 1000 houses = 6 days = 200 share = meet noise = 0.2 seed = 1 t = 500\n\n"
+    "/run agents = 1000 houses = 6 days = 200 share = meet noise = 0.2 seed = 1 t = 500\n"
+    "/run ... compress=gzip  (gzip | xz: сжатые логи)\n\n"
     "Примеры:\n"
     "/run 50 6 50 meet 0.2\n"
     "/run 50 6 50 meet 0.2 t = 200\n"
@@ -227,26 +295,28 @@ async def cmd_run(message: Message, bot: Bot) -> None:
       sid = await asyncio.to_thread(_create_session, api, cfg)
       await bot.send_message(message.chat.id, f"session = {sid} стартую")
 
-      data = await asyncio.to_thread(_start_session, api, sid, 1800.0)
+      data = await asyncio.to_thread(_start_session, api, sid)
+      data = await _wait_session(bot, message.chat.id, api, sid, data, 1800.0)
 
       csv_path = data.get("csv")
       metrics_path = data.get("metrics")
       if not isinstance(csv_path, str) or not isinstance(metrics_path, str):
         raise RuntimeError(f"server ответил без путей csv/metrics: {data}")
 
-      events = await asyncio.to_thread(_ensure_file, csv_path)
-      metrics = await asyncio.to_thread(_ensure_file, metrics_path)
+      events = await asyncio.to_thread(_ensure_file, api, sid, "csv", csv_path)
+      metrics = await asyncio.to_thread(_ensure_file, api, sid, "metrics", metrics_path)
 
       t_eff = await asyncio.to_thread(_pick_t, events, cfg.t)
 
       out_dir = LOG_DIR / f"bot_{sid}"
       await asyncio.to_thread(_run_process_log, metrics, events, out_dir, t_eff)
 
-      summary = out_dir / f"game_{sid}_summary.yaml"
+      # a cached run's events are another session's game_<sid>.csv
+      summary = Path(events_summary_path(str(out_dir), str(events)))
       if not summary.exists():
         raise FileNotFoundError(str(summary))
 
-      aw_zip = await asyncio.to_thread(_zip_awareness, out_dir, sid)
+      aw_zip = await asyncio.to_thread(_zip_awareness, out_dir, sid, summary)
 
       await bot.send_message(message.chat.id, f"session={sid} готово, отправляю файлы (t={t_eff})")
 
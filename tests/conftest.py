@@ -0,0 +1,15 @@
+import importlib
+
+import pytest
+
+
+@pytest.fixture(scope = "session")
+def server_main(tmp_path_factory):
+  # server.main reads its settings once, at import: point it at a scratch
+  # log dir and database, and leave the environment as it was
+  d = tmp_path_factory.mktemp("server")
+  with pytest.MonkeyPatch.context() as mp:
+    mp.setenv("ZEBRA_LOG_DIR", str(d))
+    mp.setenv("ZEBRA_DB", str(d / "s.db"))
+    mp.setenv("ZEBRA_WORKERS", "2")
+    return importlib.import_module("server.main")
@@ -0,0 +1,104 @@
+import time
+
+import pytest
+
+from server.admission import Admission, AdmissionError
+
+
+def _admission() -> Admission:
+  return Admission(workers = 1, max_queue_cost = 100.0, max_session_cost = 1000.0, max_client_inflight = 10)
+
+
+def test_over_session_cost_is_refused_for_good() -> None:
+  with pytest.raises(AdmissionError) as e:
+    _admission().admit("c", [("s1", 1001.0)])
+  assert e.value.retry_after is None
+
+
+def test_over_queue_cost_runs_on_an_empty_queue() -> None:
+  a = _admission()
+  a.admit("c", [("big", 500.0)])
+  assert a.inflight() == {"big": ("c", 500.0)}
+
+
+def test_over_queue_cost_waits_for_the_queue() -> None:
+  a = _admission()
+  a.admit("c", [("s1", 10.0)])
+  with pytest.raises(AdmissionError) as e:
+    a.admit("c", [("big", 500.0)])
+  assert e.value.retry_after is not None
+  a.release("s1")
+  a.admit("c", [("big", 500.0)])
+
+
+def test_refused_batch_creates_no_sessions(server_main, monkeypatch) -> None:
+  from fastapi.testclient import TestClient
+
+  m = server_main
+  monkeypatch.setattr(m, "_admission", Admission(1, max_queue_cost = 1e6, max_session_cost = 1e9, max_client_inflight = 10))
+  m._admission.admit("other", [("busy", 1e5)])
+  before = m._store.stats()["sessions"]
+  r = TestClient(m.app).post("/sessions/batch", json = {"sessions": [{"agents": 1000, "days": 200}] * 2})
+  assert r.status_code == 429
+  assert "Retry-After" in r.headers
+  assert m._store.stats()["sessions"] == before
+
+
+def _wait_status(client, sid: str) -> str:
+  t_end = time.time() + 60
+  while time.time() < t_end:
+    status = client.get(f"/session/{sid}").json()["status"]
+    if status not in ("created", "queued", "running"):
+      return status
+    time.sleep(0.05)
+  raise TimeoutError(sid)
+
+
+def test_interrupted_run_keeps_the_rate(server_main, monkeypatch) -> None:
+  from fastapi.testclient import TestClient
+
+  m = server_main
+  monkeypatch.setattr(m, "_admission", Admission(1, max_queue_cost = 1e12, max_session_cost = 1e12, max_client_inflight = 10))
+  client = TestClient(m.app)
+  rate = m._admission.stats()["rate_per_worker"]
+  cfg = {"agents": 5000, "days": 5000, "seed": 7, "deadline_sec": 0.2, "outputs": []}
+  sid = client.post("/session", json = cfg).json()["session_id"]
+  client.post(f"/session/{sid}/run")
+  assert _wait_status(client, sid) == "timeout"
+  assert m._admission.stats()["rate_per_worker"] == rate
+  assert m._admission.inflight() == {}
+
+
+def test_admitting_an_inflight_session_twice_holds_one_slot() -> None:
+  a = _admission()
+  assert a.admit("c", [("s1", 10.0)]) == ["s1"]
+  assert a.admit("c", [("s1", 10.0)]) == []
+  assert a.stats()["queued_cost"] == 10.0
+  a.release("s1")
+  assert a.inflight() == {}
+  assert a._per_client == {}
+
+
+def test_concurrent_runs_of_one_session_release_their_slot(server_main, monkeypatch) -> None:
+  from concurrent.futures import ThreadPoolExecutor
+
+  from fastapi.testclient import TestClient
+
+  m = server_main
+  monkeypatch.setattr(m, "_admission", Admission(1, max_queue_cost = 1e12, max_session_cost = 1e12, max_client_inflight = 10))
+  client = TestClient(m.app)
+  sid = client.post("/session", json = {"agents": 50, "days": 20, "seed": 3, "outputs": []}).json()["session_id"]
+  mark_queued = m._store.mark_queued
+
+  def _slow_mark_queued(sid: str) -> bool:
+    # every /run gets past the "created" check before the first one queues
+    time.sleep(0.2)
+    return mark_queued(sid)
+
+  monkeypatch.setattr(m._store, "mark_queued", _slow_mark_queued)
+  with ThreadPoolExecutor(8) as pool:
+    codes = list(pool.map(lambda _: TestClient(m.app).post(f"/session/{sid}/run").status_code, range(8)))
+  assert codes == [200] * 8
+  assert _wait_status(client, sid) == "done"
+  assert m._admission.inflight() == {}
+  assert m._admission.stats()["clients"] == 0
@@ -0,0 +1,66 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+import requests
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture
+def api(tmp_path: Path):
+  pytest.importorskip("uvicorn")
+  with socket.socket() as s:
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+  # a log dir relative to the server's own cwd: the paths it reports do not
+  # exist for the client, as with a server on another host
+  cwd = tmp_path / "server"
+  cwd.mkdir()
+  env = {
+    **os.environ,
+    "PYTHONPATH": str(ROOT),
+    "ZEBRA_LOG_DIR": "logs",
+    "ZEBRA_DB": "logs/s.db",
+    "ZEBRA_WORKERS": "1",
+  }
+  cmd = [sys.executable, "-m", "uvicorn", "server.main:app", "--port", str(port)]
+  proc = subprocess.Popen(cmd, cwd = cwd, env = env, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+  url = f"http://127.0.0.1:{port}"
+  try:
+    t_end = time.time() + 30
+    while True:
+      try:
+        requests.get(f"{url}/health", timeout = 1)
+        break
+      except requests.ConnectionError:
+        assert time.time() < t_end
+        time.sleep(0.1)
+    yield url
+  finally:
+    proc.terminate()
+    proc.wait(10)
+
+
+def test_effect_without_shared_disk(api: str, tmp_path: Path) -> None:
+  out_dir = tmp_path / "client"
+  out_dir.mkdir()
+  best = out_dir / "mt_best.yaml"
+  best.write_text("who: a0\nbest_strategy:\n  p_left: 10\n  p_right: 10\n  p_home: 60\n  p_house_exch: 10\n  p_pet_exch: 10\n", encoding = "utf-8")
+  cmd = [
+    sys.executable, "-m", "analysis.check_mt_effect",
+    "--api", api,
+    "--out_dir", str(out_dir),
+    "--mt_best", str(best),
+    "--agents", "30",
+    "--days", "20",
+    "--tail", "5",
+    "--wait", "30",
+  ]
+  proc = subprocess.run(cmd, cwd = ROOT, capture_output = True, text = True, timeout = 300, check = True)
+  assert "baseline_tail_mean(tail=5)" in proc.stdout
+  assert "override_schema = mt_who + mt_strategy" in proc.stdout
@@ -0,0 +1,22 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def test_concurrent_first_slices_build_one_store(server_main) -> None:
+  from fastapi.testclient import TestClient
+
+  m = server_main
+  client = TestClient(m.app)
+  sid = client.post("/session", json = {"agents": 300, "days": 300, "seed": 11, "outputs": ["metrics"]}).json()["session_id"]
+  client.post(f"/session/{sid}/run")
+  t_end = time.time() + 60
+  while client.get(f"/session/{sid}").json()["status"] != "done":
+    assert time.time() < t_end
+    time.sleep(0.05)
+
+  def _slice(i: int) -> int:
+    return TestClient(m.app).get(f"/session/{sid}/metrics", params = {"agents": f"a{i}"}).status_code
+
+  with ThreadPoolExecutor(8) as pool:
+    assert list(pool.map(_slice, range(16))) == [200] * 16
+  assert not list(m.LOG_DIR.glob(f"metrics_{sid}*.tmp"))
@@ -0,0 +1,33 @@
+import csv
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _run_agent(out_dir: Path, *args: str) -> subprocess.CompletedProcess:
+  cmd = [
+    sys.executable, "-m", "optimizer.mt_agent",
+    "--backend", "local",
+    "--agents", "30",
+    "--days", "12",
+    "--seeds", "1,2,3",
+    "--out_dir", str(out_dir),
+    "--logs_dir", str(out_dir),
+    *args,
+  ]
+  return subprocess.run(cmd, cwd = ROOT, capture_output = True, text = True, timeout = 600, check = True)
+
+
+@pytest.mark.parametrize("racing", ["off", "sh", "hyperband"])
+@pytest.mark.parametrize("search", ["random", "cmaes", "tpe"])
+def test_every_candidate_is_tried(tmp_path: Path, search: str, racing: str) -> None:
+  iters = 20
+  proc = _run_agent(tmp_path, "--iters", str(iters), "--search", search, "--racing", racing)
+  with open(tmp_path / "mt_trials.csv", encoding = "utf-8", newline = "") as f:
+    trials = {row["trial"] for row in csv.DictReader(f) if row["kind"] != "baseline"}
+  assert len(trials) == iters + 1
+  assert "warning:" not in proc.stdout
@@ -0,0 +1,44 @@
+import subprocess
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from analysis.process_log import events_summary_path
+from simulator.engine import run_session
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _cached_session(tmp_path: Path, compress: str | None) -> tuple[Path, Path, Path]:
+  # a repeated seeded /run is a cache hit: the new session is served the
+  # artefacts of the run that produced them, named after that run's sid
+  files = run_session("0ld5e55100aa", {"agents": 12, "days": 8, "seed": 1, "compress": compress}, tmp_path / "logs")
+  out_dir = tmp_path / "bot_9e75e5510bbb"
+  cmd = [
+    sys.executable, "-m", "analysis.process_log",
+    "--metrics", str(files["metrics"]),
+    "--events", str(files["csv"]),
+    "--t", "8",
+    "--out_dir", str(out_dir),
+  ]
+  subprocess.run(cmd, cwd = ROOT, capture_output = True, text = True, check = True)
+  return Path(files["metrics"]), Path(files["csv"]), out_dir
+
+
+@pytest.mark.parametrize("compress", [None, "gzip"])
+def test_summary_of_cached_session(tmp_path: Path, compress: str | None) -> None:
+  _, events, out_dir = _cached_session(tmp_path, compress)
+  summary = Path(events_summary_path(str(out_dir), str(events)))
+  assert summary.name == "game_0ld5e55100aa_summary.yaml"
+  assert summary.exists()
+
+
+def test_bot_zips_summary_of_cached_session(tmp_path: Path) -> None:
+  bot = pytest.importorskip("telegram_bot")
+  _, events, out_dir = _cached_session(tmp_path, "gzip")
+  summary = Path(events_summary_path(str(out_dir), str(events)))
+  zip_path = bot._zip_awareness(out_dir, "9e75e5510bbb", summary)
+  with zipfile.ZipFile(zip_path) as z:
+    assert summary.name in z.namelist()
@@ -0,0 +1,21 @@
+from pathlib import Path
+
+import pytest
+
+from server.scores import scores_from_metrics
+from simulator.engine import run_session
+
+WHO = ["a0", "a3", "a7"]
+
+
+@pytest.mark.parametrize("rows", [{}, {"metrics_every": 3}, {"metrics_every": 7}, {"metrics_days": [5, 10, 11, 40]}])
+@pytest.mark.parametrize("mode", ["final", "mean_tail"])
+def test_engine_scores_match_metrics_file(tmp_path: Path, rows: dict, mode: str) -> None:
+  cfg = {
+    "agents": 40, "houses": 6, "days": 50, "share": "meet", "noise": 0.3, "seed": 5,
+    "outputs": ["metrics"], "compress": "gzip",
+    "score": {"who": WHO, "mode": mode, "tail": 4},
+    **rows,
+  }
+  out = run_session("5c0e5a11ab1e", cfg, tmp_path)
+  assert out["scores"] == scores_from_metrics(out["metrics"], WHO, mode, 4)
@@ -0,0 +1,17 @@
+import asyncio
+
+import pytest
+
+
+@pytest.mark.parametrize("status", ["failed", "cancelled", "timeout"])
+def test_unfinished_session_is_not_a_result(status: str) -> None:
+  bot = pytest.importorskip("telegram_bot")
+  data = {"status": status, "session_id": "abc", "error": None}
+  with pytest.raises(RuntimeError, match = status):
+    asyncio.run(bot._wait_session(None, 1, "http://127.0.0.1:1", "abc", data, 10.0))
+
+
+def test_done_session_is_returned() -> None:
+  bot = pytest.importorskip("telegram_bot")
+  data = {"status": "done", "session_id": "abc"}
+  assert asyncio.run(bot._wait_session(None, 1, "http://127.0.0.1:1", "abc", data, 10.0)) is data